@@ -1,35 +1,79 @@
-import json
-import time
-import traceback
-import uuid
 import os
+
+# Socket.IO 비동기 모드 (eventlet/gevent는 다른 모듈 import 전에 monkey patch 필요)
+# .env 로드보다 먼저 patch해야 하므로 이 값은 실제 환경 변수에서만 읽음 (.env 값은 무시)
+SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading')
+if SOCKETIO_ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif SOCKETIO_ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from dotenv import load_dotenv
+load_dotenv(override=True)
+
+import atexit
+import queue
+import threading
+import traceback
 import urllib.parse
 import logging
-from flask import Flask, Response, render_template, request, send_file
+from logging.handlers import QueueHandler, QueueListener
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
+from flask import Flask, Response, render_template, request, send_from_directory, stream_with_context
 from flask_socketio import SocketIO
 
 from service.config_service import ConfigService
 from service.client_manager import ClientManager
 from service.avatar_service import AvatarService
 from service.stt_service import STTService
-from service.chat_service import chat_service
+from service.chat_service import ChatService
 from service.architecture_diagram_service import ArchitectureDiagramService
 from util.vad_iterator import VADService
+from util import json_util
 from handler.websocket_handler import WebSocketHandler
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-    ]
-)
+# 로그 출력(콘솔, app.log)은 QueueListener 스레드에서 처리하여 요청/오디오 처리 스레드가 I/O로 막히지 않도록 함
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(log_formatter)
+log_file_handler = logging.FileHandler('app.log', encoding='utf-8')
+log_file_handler.setFormatter(log_formatter)
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, log_stream_handler, log_file_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+# 루트 로거에는 QueueHandler만 둠 (포맷은 리스너 쪽 핸들러에서 한 번만 적용)
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.INFO)
+root_logger.addHandler(QueueHandler(log_queue))
 logger = logging.getLogger(__name__)
 
 config = ConfigService()
 
+# 클라이언트 해제 시 아바타/STT 정리용 스레드 풀
+TEARDOWN_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix='teardown')
+
+# 다이어그램 출력 디렉토리 (ArchitectureDiagramService가 .temp에 생성)
+DIAGRAM_DIR = os.path.join(os.getcwd(), '.temp')
+
 app = Flask(__name__, template_folder='.')
-socketio = SocketIO(app)
+app.json = json_util.OrjsonProvider(app)
+# Socket.IO 옵션 (long-polling 응답은 256바이트 이상일 때만 압축하여 작은 패킷의 압축 비용 회피)
+socketio_options = {
+    'async_mode': SOCKETIO_ASYNC_MODE,
+    'http_compression': True,
+    'compression_threshold': 256,
+}
+# Socket.IO 패킷 인코딩 (msgpack 지정 시 MessagePack, 아니면 json_util(orjson 우선) 사용)
+if config.socketio_serializer == 'msgpack':
+    socketio_options['serializer'] = 'msgpack'
+else:
+    socketio_options['json'] = json_util
+socketio = SocketIO(app, **socketio_options)
 
 client_manager = ClientManager(
     config.azure_openai_deployment_name,
@@ -45,7 +89,8 @@ avatar_service = AvatarService(
     ice_server_username=config.ice_server_username,
     ice_server_password=config.ice_server_password,
     enable_token_auth=config.enable_token_auth_for_speech,
-    default_tts_voice=config.default_tts_voice
+    default_tts_voice=config.default_tts_voice,
+    client_manager=client_manager
 )
 
 stt_service = STTService(
@@ -59,11 +104,13 @@ vad_service = VADService(
     threshold=0.5,
     sampling_rate=16000,
     min_silence_duration_ms=150,
-    speech_pad_ms=100
+    speech_pad_ms=100,
+    onnx_model_path=config.vad_onnx_model_path
 )
 
 # 아키텍처 다이어그램 서비스 초기화
 architecture_service = ArchitectureDiagramService()
+chat_service = ChatService(architecture_service)
 
 websocket_handler = WebSocketHandler(
     client_manager, avatar_service, stt_service, chat_service, vad_service, architecture_service
@@ -72,16 +119,34 @@ websocket_handler = WebSocketHandler(
 chat_service.set_client_contexts(client_manager.get_all_contexts())
 
 
+# 참으로 간주하는 헤더 값
+_TRUE_VALUES = frozenset({'true', '1', 'yes', 'on'})
+
+
+def _bool_hdr(get_header, name: str, default: bool = False) -> bool:
+    """불리언 헤더 값 파싱 (헤더 조회 1회)"""
+    value = get_header(name)
+    return default if value is None else value.lower() in _TRUE_VALUES
+
+
+def _str_hdr(get_header, name: str, default: str) -> str:
+    """문자열 헤더 값 반환 (값이 없으면 기본값)"""
+    value = get_header(name)
+    return value if value else default
+
+
 @app.route("/")
 def index():
-    return render_template("static/chat.html", methods=["GET"], client_id=client_manager.initialize_client())
+    return render_template("static/chat.html", methods=["GET"], client_id=client_manager.initialize_client(),
+                           socketio_msgpack=config.socketio_serializer == 'msgpack')
 
 
 @app.route("/chat")
 def chatView():
     return render_template("static/chat.html", methods=["GET"], 
                          client_id=client_manager.initialize_client(), 
-                         enable_websockets=config.enable_websockets)
+                         enable_websockets=config.enable_websockets,
+                         socketio_msgpack=config.socketio_serializer == 'msgpack')
 
 
 @app.route("/api/getSpeechToken", methods=["GET"])
@@ -95,34 +160,36 @@ def getSpeechToken() -> Response:
 @app.route("/api/getIceToken", methods=["GET"])
 def getIceToken() -> Response:
     ice_token = avatar_service.get_ice_token()
-    return Response(ice_token, status=200)
+    return Response(ice_token, status=200, mimetype='application/json')
 
 
 @app.route("/api/getStatus", methods=["GET"])
 def getStatus() -> Response:
-    client_id = uuid.UUID(request.headers.get('ClientId'))
+    client_id = request.headers.get('ClientId')
     status = client_manager.get_client_status(client_id)
-    return Response(json.dumps(status), status=200)
+    return Response(json_util.dumpb(status), status=200, mimetype='application/json')
 
 
 @app.route("/api/connectAvatar", methods=["POST"])
 def connectAvatar() -> Response:
-    client_id = uuid.UUID(request.headers.get('ClientId'))
-    is_reconnecting = request.headers.get('Reconnect') and request.headers.get('Reconnect').lower() == 'true'
+    # request 프록시 해석과 headers.get 속성 조회를 한 번만 수행
+    get_header = request.headers.get
+    client_id = get_header('ClientId')
+    is_reconnecting = _bool_hdr(get_header, 'Reconnect')
     client_context = client_manager.get_client_context(client_id)
     avatar_service.disconnect_avatar(client_context, is_reconnecting)
     try:
-        local_sdp = request.data.decode('utf-8')
-        avatar_character = request.headers.get('AvatarCharacter')
-        avatar_style = request.headers.get('AvatarStyle')
-        background_color = '#FFFFFFFF' if request.headers.get('BackgroundColor') is None else request.headers.get('BackgroundColor')
-        background_image_url = request.headers.get('BackgroundImageUrl')
-        is_custom_avatar = request.headers.get('IsCustomAvatar', 'false').lower() == 'true'
-        transparent_background = request.headers.get('TransparentBackground', 'false').lower() == 'true'
-        video_crop = request.headers.get('VideoCrop', 'false').lower() == 'true'
-        tts_voice = request.headers.get('TtsVoice')
-        custom_voice_endpoint_id = request.headers.get('CustomVoiceEndpointId')
-        personal_voice_speaker_profile_id = request.headers.get('PersonalVoiceSpeakerProfileId')
+        local_sdp = request.get_data(cache=False, as_text=True)
+        avatar_character = get_header('AvatarCharacter')
+        avatar_style = get_header('AvatarStyle')
+        background_color = _str_hdr(get_header, 'BackgroundColor', '#FFFFFFFF')
+        background_image_url = get_header('BackgroundImageUrl')
+        is_custom_avatar = _bool_hdr(get_header, 'IsCustomAvatar')
+        transparent_background = _bool_hdr(get_header, 'TransparentBackground')
+        video_crop = _bool_hdr(get_header, 'VideoCrop')
+        tts_voice = get_header('TtsVoice')
+        custom_voice_endpoint_id = get_header('CustomVoiceEndpointId')
+        personal_voice_speaker_profile_id = get_header('PersonalVoiceSpeakerProfileId')
         remote_sdp = avatar_service.connect_avatar(
             client_context=client_context,
             local_sdp=local_sdp,
@@ -149,18 +216,16 @@ def connectAvatar() -> Response:
 
 @app.route("/api/connectSTT", methods=["POST"])
 def connectSTT() -> Response:
-    client_id = uuid.UUID(request.headers.get('ClientId'))
-    system_prompt = request.headers.get('SystemPrompt')
+    get_header = request.headers.get
+    client_id = get_header('ClientId')
+    system_prompt = get_header('SystemPrompt')
     client_context = client_manager.get_client_context(client_id)
     try:
-        def speak_with_queue_wrapper(text, ending_silence_ms, target_client_id):
-            target_context = client_manager.get_client_context(target_client_id)
-            avatar_service.speak_with_queue(text, ending_silence_ms, target_context, target_client_id)
         stt_service.connect_stt(
             client_context=client_context,
             system_prompt=system_prompt,
             chat_service=chat_service,
-            speak_with_queue_func=speak_with_queue_wrapper,
+            speak_with_queue_func=avatar_service.speak_with_queue_by_client,
             client_id=client_id,
             socketio=socketio if config.enable_websockets else None,
             vad_iterator=vad_service.get_vad_iterator(),
@@ -173,7 +238,7 @@ def connectSTT() -> Response:
 
 @app.route("/api/disconnectSTT", methods=["POST"])
 def disconnectSTT() -> Response:
-    client_id = uuid.UUID(request.headers.get('ClientId'))
+    client_id = request.headers.get('ClientId')
     try:
         client_context = client_manager.get_client_context(client_id)
         stt_service.disconnect_stt(client_context)
@@ -184,9 +249,9 @@ def disconnectSTT() -> Response:
 
 @app.route("/api/speak", methods=["POST"])
 def speak() -> Response:
-    client_id = uuid.UUID(request.headers.get('ClientId'))
+    client_id = request.headers.get('ClientId')
     try:
-        ssml = request.data.decode('utf-8')
+        ssml = request.get_data(cache=False, as_text=True)
         client_context = client_manager.get_client_context(client_id)
         result_id = avatar_service.speak_ssml(ssml, client_context, True)
         return Response(result_id, status=200)
@@ -196,7 +261,7 @@ def speak() -> Response:
 
 @app.route("/api/stopSpeaking", methods=["POST"])
 def stopSpeaking() -> Response:
-    client_id = uuid.UUID(request.headers.get('ClientId'))
+    client_id = request.headers.get('ClientId')
     client_context = client_manager.get_client_context(client_id)
     avatar_service.stop_speaking(client_context, False)
     return Response('Speaking stopped.', status=200)
@@ -204,10 +269,9 @@ def stopSpeaking() -> Response:
 
 @app.route("/api/chat", methods=["POST"])
 def chat() -> Response:
-    client_id = uuid.UUID(request.headers.get('ClientId'))
+    client_id = request.headers.get('ClientId')
     client_context = client_manager.get_client_context(client_id)
-    chat_initiated = client_context.get('chat_initiated', False)
-    if not chat_initiated:
+    if not client_context.get('chat_initiated'):
         chat_service.initialize_chat_context(request.headers.get('SystemPrompt'), client_id)
         client_context['chat_initiated'] = True
     
@@ -223,32 +287,33 @@ def chat() -> Response:
         # 클라이언트 컨텍스트에 현재 구조 저장
         if current_structure:
             client_context['current_structure'] = current_structure
-            logger.info(f"Received structure from client for {client_id}: {len(current_structure)} characters")
+            logger.info("Received structure from client for %s: %d characters", client_id, len(current_structure))
         
-        logger.info(f"Processing JSON request for {client_id}: query={user_query[:50]}...")
+        logger.info("Processing JSON request for %s: query=%.50s...", client_id, user_query)
         
     except Exception as e:
         logger.error(f"Failed to parse JSON request: {e}")
         return Response(f'Invalid JSON request: {str(e)}', status=400)
     
-    def speak_with_queue_wrapper(text, ending_silence_ms, target_client_id):
-        target_context = client_manager.get_client_context(target_client_id)
-        avatar_service.speak_with_queue(text, ending_silence_ms, target_context, target_client_id)
-    return Response(
-        chat_service.handle_user_query(user_query, client_id, speak_with_queue_wrapper), 
+    response = Response(
+        stream_with_context(chat_service.handle_user_query(user_query, client_id, avatar_service.speak_with_queue_by_client)), 
         mimetype='text/plain', 
         status=200
     )
+    # 프록시(nginx 등) 버퍼링 비활성화로 첫 토큰을 즉시 전달
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 
 @app.route("/api/chat/continueSpeaking", methods=["POST"])
 def continueSpeaking() -> Response:
-    client_id = uuid.UUID(request.headers.get('ClientId'))
+    client_id = request.headers.get('ClientId')
     client_context = client_manager.get_client_context(client_id)
-    spoken_text_queue = client_context.get('spoken_text_queue', [])
+    spoken_text_queue = client_context.get('spoken_text_queue', deque())
     speaking_text = client_context.get('speaking_text')
     if speaking_text and config.repeat_speaking_sentence_after_reconnection:
-        spoken_text_queue.insert(0, speaking_text)
+        spoken_text_queue.appendleft(speaking_text)
     if len(spoken_text_queue) > 0:
         avatar_service.speak_with_queue(None, 0, client_context, client_id)
     return Response('Request sent.', status=200)
@@ -256,7 +321,7 @@ def continueSpeaking() -> Response:
 
 @app.route("/api/chat/clearHistory", methods=["POST"])
 def clearChatHistory() -> Response:
-    client_id = uuid.UUID(request.headers.get('ClientId'))
+    client_id = request.headers.get('ClientId')
     client_context = client_manager.get_client_context(client_id)
     chat_service.initialize_chat_context(request.headers.get('SystemPrompt'), client_id)
     client_context['chat_initiated'] = True
@@ -265,7 +330,7 @@ def clearChatHistory() -> Response:
 
 @app.route("/api/disconnectAvatar", methods=["POST"])
 def disconnectAvatar() -> Response:
-    client_id = uuid.UUID(request.headers.get('ClientId'))
+    client_id = request.headers.get('ClientId')
     try:
         client_context = client_manager.get_client_context(client_id)
         avatar_service.disconnect_avatar(client_context, False)
@@ -274,15 +339,53 @@ def disconnectAvatar() -> Response:
         return Response(traceback.format_exc(), status=400)
 
 
+def _release_client_state(client_id: str):
+    websocket_handler.release_client(client_id)
+    vad_service.release_client(client_id)
+    client_manager.release_client(client_id)
+
+
+def _release_client_after(client_id: str, pending: set):
+    """남은 정리 작업이 모두 끝난 뒤 클라이언트 상태를 한 번만 해제"""
+    remaining = [len(pending)]
+    lock = threading.Lock()
+
+    def on_done(teardown):
+        if teardown.exception():
+            logger.error(f"Client teardown failed for {client_id}: {teardown.exception()}")
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        try:
+            _release_client_state(client_id)
+        except Exception as e:
+            logger.error(f"Client context release failed. Error message: {e}")
+
+    for teardown in pending:
+        teardown.add_done_callback(on_done)
+
+
 @app.route("/api/releaseClient", methods=["POST"])
 def releaseClient() -> Response:
-    client_id = uuid.UUID(json.loads(request.data)['clientId'])
+    # sendBeacon은 text/plain으로 전송하므로 force=True
+    client_id = request.get_json(force=True, cache=False)['clientId']
     try:
         client_context = client_manager.get_client_context(client_id)
-        avatar_service.disconnect_avatar(client_context, False)
-        stt_service.disconnect_stt(client_context)
-        time.sleep(2)
-        client_manager.release_client(client_id)
+        # 아바타/STT 정리를 병렬로 진행하고 전체 2초 기한 안에서만 기다림
+        teardowns = [
+            TEARDOWN_POOL.submit(avatar_service.disconnect_avatar, client_context, False),
+            TEARDOWN_POOL.submit(stt_service.disconnect_stt, client_context),
+        ]
+        finished, pending = futures_wait(teardowns, timeout=2.0)
+        for teardown in finished:
+            if teardown.exception():
+                raise teardown.exception()
+        if pending:
+            # 끝나지 않은 정리가 있으면 컨텍스트 해제는 마지막 정리의 완료 콜백에서 수행
+            _release_client_after(client_id, pending)
+            return Response('Client context release scheduled.', status=200)
+        _release_client_state(client_id)
         return Response('Client context released.', status=200)
     except Exception as e:
         logger.error(f"Client context release failed. Error message: {e}")
@@ -293,14 +396,21 @@ def serveDiagram(diagram_path):
     """다이어그램 파일을 서빙하는 엔드포인트"""
     try:
         # URL 디코딩
-        decoded_path = urllib.parse.unquote(diagram_path)
+        decoded_path = os.path.abspath(urllib.parse.unquote(diagram_path))
+        
+        # 다이어그램 디렉토리 밖의 경로 접근 차단
+        if os.path.commonpath([decoded_path, DIAGRAM_DIR]) != DIAGRAM_DIR:
+            return Response('Diagram file not found.', status=404)
         
         # 파일 존재 여부 확인
-        if not os.path.exists(decoded_path):
+        if not os.path.isfile(decoded_path):
             return Response('Diagram file not found.', status=404)
         
-        # 파일 전송
-        return send_file(decoded_path, mimetype='image/png')
+        # 파일 전송 (조건부 GET 지원, 다이어그램 파일명은 고유하므로 캐시 허용)
+        return send_from_directory(
+            DIAGRAM_DIR, os.path.relpath(decoded_path, DIAGRAM_DIR),
+            conditional=True, max_age=3600
+        )
     except Exception as e:
         logger.error(f"Error serving diagram: {e}")
         return Response(f"Error serving diagram: {e}", status=500)
@@ -310,7 +420,7 @@ def serveDiagram(diagram_path):
 def updateStructure():
     """구조 JSON 업데이트 엔드포인트"""
     try:
-        client_id = uuid.UUID(request.headers.get('ClientId'))
+        client_id = request.headers.get('ClientId')
         data = request.get_json()
         
         if not data:
@@ -337,6 +447,11 @@ def handleWsConnection():
     websocket_handler.handle_connection(socketio)
 
 
+@socketio.on("disconnect")
+def handleWsDisconnection():
+    websocket_handler.handle_disconnect()
+
+
 @socketio.on("message")
 def handleWsMessage(message):
     websocket_handler.handle_message(message, socketio)
@@ -1,12 +1,16 @@
 import base64
-import uuid
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from flask import request
 from flask_socketio import join_room
+from util.chat_emitter import ChatResponseEmitter
 
 # 로거 설정
 logger = logging.getLogger(__name__)
 
+# Bicep 생성 워커 스레드 풀
+BICEP_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix='bicep')
+
 
 class WebSocketHandler:
     def __init__(self, client_manager, avatar_service, stt_service, chat_service, vad_service, architecture_service=None):
@@ -16,32 +20,61 @@ class WebSocketHandler:
         self.chat_service = chat_service
         self.vad_service = vad_service
         self.architecture_service = architecture_service
+        # 메시지 path별 처리기
+        self._dispatch = {
+            'api.audio': self._handle_audio_message,
+            'api.chat': self._handle_chat_message,
+            'api.stopSpeaking': self._handle_stop_speaking,
+            'api.bicep': self._handle_bicep_generation,
+        }
+        # Socket.IO 연결(sid)별 (client_id, client_context) 캐시와 client_id별 sid 목록
+        self._sid_contexts = {}
+        self._client_sids = {}
     
     def handle_connection(self, socketio):
         """WebSocket 연결 처리"""
-        client_id = uuid.UUID(request.args.get('clientId'))
+        client_id = request.args.get('clientId')
         join_room(client_id)
+        client_context = self.client_manager.get_client_context(client_id)
+        if client_context:
+            self._sid_contexts[request.sid] = (client_id, client_context)
+            self._client_sids.setdefault(client_id, set()).add(request.sid)
         logger.info(f"WebSocket connected for client {client_id}.")
     
+    def handle_disconnect(self):
+        """WebSocket 연결 해제 처리"""
+        cached = self._sid_contexts.pop(request.sid, None)
+        if cached:
+            self._client_sids.get(cached[0], set()).discard(request.sid)
+    
+    def release_client(self, client_id):
+        """해제된 클라이언트의 sid 캐시 제거 (해제된 컨텍스트를 재사용하지 않도록)"""
+        for sid in self._client_sids.pop(client_id, ()):
+            self._sid_contexts.pop(sid, None)
+    
     def handle_message(self, message, socketio):
         """WebSocket 메시지 처리"""
-        client_id = uuid.UUID(message.get('clientId'))
-        path = message.get('path')
-        client_context = self.client_manager.get_client_context(client_id)
-        
-        if path == 'api.audio':
-            self._handle_audio_message(message, client_context, client_id, socketio)
-        elif path == 'api.chat':
-            self._handle_chat_message(message, client_context, client_id, socketio)
-        elif path == 'api.stopSpeaking':
-            self._handle_stop_speaking(client_context, client_id)
-        elif path == 'api.bicep':
-            self._handle_bicep_generation(message, client_context, client_id, socketio)
+        client_id = message.get('clientId')
+        handler = self._dispatch.get(message.get('path'))
+        if handler:
+            cached = self._sid_contexts.get(request.sid)
+            if cached and cached[0] == client_id:
+                client_context = cached[1]
+            else:
+                client_context = self.client_manager.get_client_context(client_id)
+            handler(message, client_context, client_id, socketio)
     
     def _handle_audio_message(self, message, client_context, client_id, socketio):
         """오디오 메시지 처리"""
         audio_chunk = message.get('audioChunk')
-        audio_chunk_binary = base64.b64decode(audio_chunk)
+        if isinstance(audio_chunk, bytes):
+            # 바이너리 프레임으로 수신한 PCM은 디코딩 없이 그대로 사용
+            audio_chunk_binary = audio_chunk
+        elif isinstance(audio_chunk, (bytearray, memoryview)):
+            audio_chunk_binary = bytes(audio_chunk)
+        else:
+            # 이전 클라이언트 호환 (base64 문자열)
+            audio_chunk_binary = base64.b64decode(audio_chunk.encode('ascii'))
         
         # STT 서비스로 오디오 처리
         self.stt_service.handle_audio_chunk(
@@ -54,8 +87,7 @@ class WebSocketHandler:
     
     def _handle_chat_message(self, message, client_context, client_id, socketio):
         """채팅 메시지 처리"""
-        chat_initiated = client_context.get('chat_initiated', False)
-        if not chat_initiated:
+        if not client_context.get('chat_initiated'):
             self.chat_service.initialize_chat_context(message.get('systemPrompt'), client_id)
             client_context['chat_initiated'] = True
         
@@ -67,28 +99,25 @@ class WebSocketHandler:
         # 클라이언트 컨텍스트에 현재 구조 저장
         if current_structure:
             client_context['current_structure'] = current_structure
-            logger.info(f"Received structure from WebSocket client {client_id}: {len(current_structure)} characters")
+            logger.info("Received structure from WebSocket client %s: %d characters", client_id, len(current_structure))
         
-        logger.info(f"Processing WebSocket JSON message for {client_id}: query={user_query[:50]}...")
+        logger.info("Processing WebSocket JSON message for %s: query=%.50s...", client_id, user_query)
         
         first_response_chunk = True
+        emitter = ChatResponseEmitter(socketio, client_id)
         
         for chat_response in self.chat_service.handle_user_query(
-            user_query, client_id, self.avatar_service.speak_with_queue
+            user_query, client_id, self.avatar_service.speak_with_queue_by_client
         ):
             if first_response_chunk:
-                socketio.emit("response", {
-                    'path': 'api.chat', 
-                    'chatResponse': 'Assistant: '
-                }, room=client_id)
+                emitter.write('Assistant: ')
                 first_response_chunk = False
             
-            socketio.emit("response", {
-                'path': 'api.chat', 
-                'chatResponse': chat_response
-            }, room=client_id)
+            emitter.write(chat_response)
+        
+        emitter.flush()
     
-    def _handle_stop_speaking(self, client_context, client_id):
+    def _handle_stop_speaking(self, message, client_context, client_id, socketio):
         """음성 출력 중지 처리"""
         self.avatar_service.stop_speaking(client_context, False)
     
@@ -124,6 +153,15 @@ class WebSocketHandler:
                 'message': '🔄 Bicep 인프라 코드를 생성하고 있습니다...'
             }, room=client_id)
             
+            # LLM 호출이 길어 Socket.IO 워커를 막지 않도록 별도 스레드 풀에서 생성
+            BICEP_POOL.submit(self._generate_bicep, structure_json, client_id, socketio)
+                
+        except Exception as e:
+            self._emit_bicep_exception(e, client_id, socketio)
+    
+    def _generate_bicep(self, structure_json, client_id, socketio):
+        """Bicep 코드 생성 후 결과 전송 (워커 스레드에서 실행)"""
+        try:
             # Bicep 코드 생성
             bicep_result = self.architecture_service.generate_bicep_infrastructure(structure_json)
             
@@ -131,33 +169,32 @@ class WebSocketHandler:
                 # 성공적으로 생성된 경우
                 logger.info(f"Bicep code generated successfully for client {client_id}")
                 
-                response_message = "✅ **Bicep 인프라 코드가 성공적으로 생성되었습니다!**\n\n"
+                bicep_code = bicep_result.get('bicep_code')
+                parameters_file = bicep_result.get('parameters_file')
+                deployment_guide = bicep_result.get('deployment_guide')
+                
+                # 큰 문자열을 반복 += 하지 않고 조각을 모아 한 번에 결합
+                parts = ["✅ **Bicep 인프라 코드가 성공적으로 생성되었습니다!**\n\n"]
                 
                 # Bicep 메인 파일
-                if bicep_result.get('bicep_code'):
-                    response_message += "## 📄 main.bicep\n\n"
-                    response_message += "```bicep\n"
-                    response_message += bicep_result['bicep_code']
-                    response_message += "\n```\n\n"
+                if bicep_code:
+                    parts += ("## 📄 main.bicep\n\n```bicep\n", bicep_code, "\n```\n\n")
                 
                 # 파라미터 파일
-                if bicep_result.get('parameters_file'):
-                    response_message += "## ⚙️ main.bicepparam\n\n"
-                    response_message += "```bicepparam\n"
-                    response_message += bicep_result['parameters_file']
-                    response_message += "\n```\n\n"
+                if parameters_file:
+                    parts += ("## ⚙️ main.bicepparam\n\n```bicepparam\n", parameters_file, "\n```\n\n")
                 
                 # 배포 가이드
-                if bicep_result.get('deployment_guide'):
-                    response_message += bicep_result['deployment_guide']
+                if deployment_guide:
+                    parts.append(deployment_guide)
                 
                 socketio.emit("response", {
                     'path': 'api.bicep',
                     'status': 'completed',
-                    'message': response_message,
-                    'bicep_code': bicep_result.get('bicep_code'),
-                    'parameters_file': bicep_result.get('parameters_file'),
-                    'deployment_guide': bicep_result.get('deployment_guide'),
+                    'message': ''.join(parts),
+                    'bicep_code': bicep_code,
+                    'parameters_file': parameters_file,
+                    'deployment_guide': deployment_guide,
                     'resource_count': bicep_result.get('resource_count', 0)
                 }, room=client_id)
                 
@@ -173,11 +210,14 @@ class WebSocketHandler:
                 }, room=client_id)
                 
         except Exception as e:
-            error_message = f"❌ Bicep 코드 생성 중 오류가 발생했습니다: {str(e)}"
-            logger.exception(f"Exception during Bicep generation for client {client_id}: {str(e)}")
-            
-            socketio.emit("response", {
-                'path': 'api.bicep',
-                'status': 'error', 
-                'error': error_message
-            }, room=client_id)
+            self._emit_bicep_exception(e, client_id, socketio)
+    
+    def _emit_bicep_exception(self, e, client_id, socketio):
+        error_message = f"❌ Bicep 코드 생성 중 오류가 발생했습니다: {str(e)}"
+        logger.exception(f"Exception during Bicep generation for client {client_id}: {str(e)}")
+        
+        socketio.emit("response", {
+            'path': 'api.bicep',
+            'status': 'error', 
+            'error': error_message
+        }, room=client_id)
@@ -1,118 +1,875 @@
 import os
-import uuid
+import re
 import json
+import queue
+import string
+import functools
+import hashlib
 import logging
-from typing import Dict, Any, Union
+import subprocess
+import tempfile
+import threading
+import time
+import types
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Any, Iterator, List, Mapping, Optional, Union
+import httpx
+import numpy as np
 from openai import AzureOpenAI
+from util import json_util
+from util.sqlite_cache import SqliteTTLCache
+
+# 노드 아이콘(diagrams 패키지에 포함된 이미지) 경로는 첫 다이어그램 생성 시에 조회 (None: 아직 시도하지 않음)
+DIAGRAMS_AVAILABLE = None
+_DIAGRAMS_LOCK = threading.Lock()
 
 try:
-    from diagrams import Diagram, Cluster, Edge
-    from diagrams.azure.compute import AppServices, FunctionApps, ContainerInstances, VM, ContainerApps, KubernetesServices   
-    from diagrams.azure.database import DatabaseForPostgresqlServers, CosmosDb, SQLDatabases
-    from diagrams.azure.storage import StorageAccounts, BlobStorage
-    from diagrams.azure.network import LoadBalancers, ApplicationGateway, CDNProfiles, VirtualNetworks, Subnets, Firewall, FrontDoors
-    
-    from diagrams.azure.integration import ServiceBus, LogicApps, APIManagement
-    from diagrams.azure.analytics import SynapseAnalytics, DataFactories, EventHubs
-    from diagrams.azure.ml import MachineLearningServiceWorkspaces, CognitiveServices, AzureOpenAI as OpenAI
-    from diagrams.azure.monitor import Monitor
-    from diagrams.azure.security import KeyVaults, SecurityCenter, ApplicationSecurityGroups
-    from diagrams.azure.devops import Devops
-    from diagrams.onprem.client import Users
-    DIAGRAMS_AVAILABLE = True
+    import diskcache
+    DISKCACHE_AVAILABLE = True
+except ImportError:
+    DISKCACHE_AVAILABLE = False
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401  (httpx HTTP/2 지원에 필요)
+    H2_AVAILABLE = True
 except ImportError:
-    DIAGRAMS_AVAILABLE = False
+    H2_AVAILABLE = False
+
+
+@dataclass(frozen=True)
+class AzureConfig:
+    """아키텍처 서비스용 Azure OpenAI 설정 (import 시 환경 변수에서 한 번 읽음)"""
+    endpoint: Optional[str]
+    api_key: Optional[str]
+    deployment: Optional[str]
+    # 구조 추출(JSON) 전용 배포 (gpt-4o-mini 같은 작은 모델 권장, 미설정 시 기본 배포 사용)
+    structure_deployment: Optional[str]
+
+    @classmethod
+    def from_env(cls) -> 'AzureConfig':
+        deployment = os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME')
+        return cls(
+            endpoint=os.environ.get('AZURE_OPENAI_ENDPOINT'),
+            api_key=os.environ.get('AZURE_OPENAI_API_KEY'),
+            deployment=deployment,
+            structure_deployment=os.environ.get('AZURE_OPENAI_STRUCTURE_DEPLOYMENT') or deployment
+        )
 
-azure_openai_endpoint = os.environ.get('AZURE_OPENAI_ENDPOINT')
-azure_openai_api_key = os.environ.get('AZURE_OPENAI_API_KEY')
-azure_openai_deployment_name = os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME')
+
+AZURE_CONFIG = AzureConfig.from_env()
 
 # Logger 설정
 logger = logging.getLogger(__name__)
 
+
+# 429/5xx/타임아웃 등 일시적 오류 시 SDK가 지수 백오프(jitter 포함, Retry-After 준수)로 재시도하는 횟수
+AZURE_OPENAI_MAX_RETRIES = int(os.environ.get('AZURE_OPENAI_MAX_RETRIES', '3'))
+
+
+def _create_client(config: AzureConfig) -> Optional[AzureOpenAI]:
+    """연결 풀(h2 설치 시 HTTP/2)을 사용하는 Azure OpenAI 클라이언트 생성 (엔드포인트/키가 없으면 None)"""
+    if not (config.endpoint and config.api_key):
+        return None
+    return AzureOpenAI(
+        azure_endpoint=config.endpoint,
+        api_version='2024-08-01-preview',
+        api_key=config.api_key,
+        max_retries=AZURE_OPENAI_MAX_RETRIES,
+        http_client=httpx.Client(
+            http2=H2_AVAILABLE,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20)
+        )
+    )
+
+
+# 기본 설정을 쓰는 모든 서비스 인스턴스가 공유하는 클라이언트
+azure_openai = _create_client(AZURE_CONFIG)
+
+# 유휴 연결이 끊기지 않도록 주기적으로 가벼운 요청을 보냄 (0이면 사용 안 함)
+AZURE_OPENAI_KEEPALIVE_S = float(os.environ.get('AZURE_OPENAI_KEEPALIVE_S', '45'))
+_keepalive_started = False
+_keepalive_lock = threading.Lock()
+
+
+def _keepalive_loop():
+    while True:
+        time.sleep(AZURE_OPENAI_KEEPALIVE_S)
+        try:
+            azure_openai.models.list()
+        except Exception as e:
+            logger.debug("Azure OpenAI keep-alive failed: %s", e)
+
+
+def _start_keepalive():
+    """keep-alive 스레드를 프로세스당 한 번만 시작합니다."""
+    global _keepalive_started
+    if azure_openai is None or AZURE_OPENAI_KEEPALIVE_S <= 0:
+        return
+    with _keepalive_lock:
+        if not _keepalive_started:
+            threading.Thread(target=_keepalive_loop, name='aoai-keepalive', daemon=True).start()
+            _keepalive_started = True
+
+# 다이어그램 렌더링 스레드 풀 (설명 생성 LLM 호출과 병렬로 실행)
+DIAGRAM_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix='diagram')
+
+# 다이어그램에 사용할 수 있는 Azure 서비스 (service id -> 표시 이름)
+AZURE_SERVICE_NAMES = {
+    'app_service': 'Azure App Service (웹 애플리케이션)',
+    'function_app': 'Azure Functions (서버리스 함수)',
+    'container_instances': 'Azure Container Instances',
+    'virtual_machines': 'Azure Virtual Machines',
+    'container_apps': 'Azure Container Apps',
+    'kubernetes_services': 'Azure Kubernetes Services',
+    'postgresql': 'Azure Database for PostgreSQL',
+    'cosmos_db': 'Azure Cosmos DB',
+    'sql_database': 'Azure SQL Database',
+    'storage_account': 'Azure Storage Account',
+    'blob_storage': 'Azure Blob Storage',
+    'load_balancer': 'Azure Load Balancer',
+    'application_gateway': 'Azure Application Gateway',
+    'cdn': 'Azure CDN',
+    'virtual_network': 'Azure Virtual Network',
+    'subnet': 'Azure Subnet',
+    'firewall': 'Azure Firewall',
+    'front_door': 'Azure Front Door',
+    'application_security_group': 'Azure Application Security Group',
+    'api_management': 'Azure API Management',
+    'service_bus': 'Azure Service Bus',
+    'event_hubs': 'Azure Event Hubs',
+    'logic_apps': 'Azure Logic Apps',
+    'synapse': 'Azure Synapse Analytics',
+    'data_factory': 'Azure Data Factory',
+    'ml_workspace': 'Azure Machine Learning',
+    'cognitive_services': 'Azure Cognitive Services',
+    'openai': 'Azure OpenAI',
+    'monitor': 'Azure Monitor',
+    'key_vault': 'Azure Key Vault',
+    'security_center': 'Azure Security Center',
+    'devops': 'Azure DevOps',
+    'users': 'Users/Clients',
+}
+
+# 프롬프트에 나열할 service id 목록
+_SERVICE_ID_LIST = ', '.join(AZURE_SERVICE_NAMES)
+
+# 서비스 id와 표시 이름 목록 (Bicep 프롬프트용)
+AZURE_SERVICES_DESCRIPTION = "사용 가능한 Azure 서비스들:\n" + "\n".join(
+    f"        - {service_id}: {name}" for service_id, name in AZURE_SERVICE_NAMES.items()
+)
+
+# 고정 system 프롬프트 (요청마다 다시 만들지 않도록 모듈 로드 시 한 번 구성)
+_ANALYZE_SYS_PROMPT = (
+    "당신은 Azure 아키텍처 전문가입니다. 요구사항에 맞는 Azure 아키텍처 다이어그램 구조를 스키마에 따라 JSON으로 생성하세요. "
+    f"service ∈ {{{_SERVICE_ID_LIST}}}"
+)
+
+_BATCH_ANALYZE_SYS_PROMPT = (
+    "당신은 Azure 아키텍처 전문가입니다. requirements 배열의 각 요구사항마다 Azure 아키텍처 다이어그램 구조를 "
+    "스키마에 따라 생성하여 같은 순서로 results 배열에 담으세요. "
+    f"service ∈ {{{_SERVICE_ID_LIST}}}"
+)
+
+_MODIFY_SYS_PROMPT = (
+    "당신은 Azure 아키텍처 전문가입니다. 기존 아키텍처 구조에 변경 요구사항을 적용한 다이어그램 구조를 스키마에 따라 JSON으로 생성하세요. "
+    "기존 구성 요소와 연결은 최대한 유지하고 필요한 추가/제거/연결 변경만 적용하세요. "
+    f"service ∈ {{{_SERVICE_ID_LIST}}}"
+)
+
+_DESCRIBE_SYS_PROMPT = """
+당신은 Azure 아키텍처 전문가입니다. 주어진 아키텍처 다이어그램 구조와 원래 요구사항을 바탕으로 
+상세한 설명을 작성해주세요. 다음 내용을 포함해야 합니다:
+
+1. 아키텍처 개요
+2. 주요 구성 요소 설명
+3. 데이터 흐름 설명
+4. 보안 고려사항
+5. 확장성 및 가용성 고려사항
+6. 비용 최적화 방안
+
+한국어로 작성해주세요.
+"""
+
+_MODIFY_DESCRIBE_SYS_PROMPT = """
+당신은 Azure 아키텍처 전문가입니다. 기존 아키텍처 구조, 수정된 아키텍처 구조, 그리고 변경 요구사항을 바탕으로 
+수정 사항에 대한 상세한 설명을 작성해주세요. 다음 내용을 포함해야 합니다:
+
+1. 수정 개요 (무엇이 변경되었는지)
+2. 변경된 구성 요소 설명
+3. 새로 추가된 구성 요소 (있는 경우)
+4. 제거된 구성 요소 (있는 경우)
+5. 변경된 데이터 흐름 설명
+6. 수정으로 인한 이점
+7. 추가 고려사항
+
+한국어로 작성해주세요.
+"""
+
+_ANALYZE_AND_DESCRIBE_SYS_PROMPT = (
+    _ANALYZE_SYS_PROMPT
+    + "\n\ndescription에는 이 구조에 대한 한국어 설명(아키텍처 개요, 주요 구성 요소, 데이터 흐름, 보안, 확장성 및 가용성, 비용 최적화)을 작성하세요."
+)
+
+# 고정 system 프롬프트별 messages prefix (user 메시지만 덧붙여 사용)
+# Bicep 생성 system 프롬프트: 서비스 매핑과 고정 지침을 앞에 두어 요청 간 프롬프트 prefix가 동일하도록 구성
+# (Azure OpenAI prompt caching은 동일한 prefix에 대해 자동으로 적용됨)
+_BICEP_SYS_PROMPT = f"""당신은 Azure Bicep 인프라 코드 생성 전문가입니다. 주어진 아키텍처 구조를 분석하여 완전하고 배포 가능한 Bicep 코드를 생성해주세요. Azure 모범 사례를 따르고, 보안, 가용성, 확장성을 고려한 코드를 작성해주세요.
+
+다음 서비스 매핑을 참고하세요:
+{AZURE_SERVICES_DESCRIPTION}
+
+## 요구사항:
+1. **Bicep 모범 사례 준수**:
+   - 리소스 명명 규칙 적용 (prefix, suffix, 환경별 구분)
+   - 매개변수와 변수 적절히 사용
+   - 태그를 활용한 리소스 관리
+   - User-Defined Types 활용
+   - @secure() 데코레이터 사용
+
+2. **보안 고려사항**:
+   - Managed Identity 사용
+   - Key Vault 통합
+   - 네트워크 보안 그룹 설정
+   - HTTPS/TLS 강제
+
+3. **운영 고려사항**:
+   - 모니터링 및 로깅 설정
+   - 백업 및 재해 복구
+   - 자동 스케일링 구성
+   - 비용 최적화
+
+4. **출력 형식**:
+   - main.bicep: 메인 인프라 코드
+   - main.bicepparam: 매개변수 파일
+   - 각 파일을 명확하게 구분하여 출력
+
+완전하고 배포 가능한 Bicep 코드를 생성해주세요. 각 파일은 ```bicep 또는 ```bicepparam 코드 블록으로 구분하여 출력해주세요.
+"""
+
+_SYSTEM_MESSAGE_PREFIXES = {
+    prompt: [{"role": "system", "content": prompt}]
+    for prompt in (_ANALYZE_SYS_PROMPT, _BATCH_ANALYZE_SYS_PROMPT, _MODIFY_SYS_PROMPT,
+                   _DESCRIBE_SYS_PROMPT, _MODIFY_DESCRIBE_SYS_PROMPT, _BICEP_SYS_PROMPT,
+                   _ANALYZE_AND_DESCRIBE_SYS_PROMPT)
+}
+
+# 구조 추출은 결정적으로, 설명은 약간의 다양성을 두고 생성 (max_tokens로 응답 길이 상한)
+STRUCTURE_COMPLETION_OPTIONS = {'temperature': 0, 'max_tokens': 1024, 'seed': 42}
+DESCRIPTION_COMPLETION_OPTIONS = {'temperature': 0.5, 'max_tokens': 1500}
+
+# true이면 generate_architecture_diagram이 구조와 설명을 한 번의 chat completion으로 생성 (왕복 1회 절약, 렌더링과의 병렬화는 포기)
+ARCHITECTURE_COMBINED_COMPLETION = os.environ.get('ARCHITECTURE_COMBINED_COMPLETION', 'false').lower() == 'true'
+
+# 0보다 크면 이 시간(ms) 안에 동시에 들어온 구조 분석 요청을 최대 ARCHITECTURE_BATCH_MAX개씩 한 번의 chat completion으로 묶음
+ARCHITECTURE_BATCH_WINDOW_MS = float(os.environ.get('ARCHITECTURE_BATCH_WINDOW_MS', '0'))
+ARCHITECTURE_BATCH_MAX = 4
+
+# Graphviz dot 렌더링 제한 시간
+DOT_RENDER_TIMEOUT_S = 30
+
+# 다이어그램 출력 형식 (png 또는 svg)
+DIAGRAM_FORMAT = os.environ.get('DIAGRAM_FORMAT', 'png').lower()
+if DIAGRAM_FORMAT not in ('png', 'svg'):
+    DIAGRAM_FORMAT = 'png'
+
+# 다이어그램 파일 위치: tmpfs(/dev/shm)가 있으면 메모리에 쓰고 .temp/diagrams 심볼릭 링크로 노출
+DIAGRAM_URL_DIR = '.temp/diagrams'
+DIAGRAM_LINK_DIR = os.path.join(os.getcwd(), '.temp', 'diagrams')
+DIAGRAM_OUTPUT_DIR = '/dev/shm/avatar_diagrams' if os.path.isdir('/dev/shm') else DIAGRAM_LINK_DIR
+
+# 이 시간보다 오래된 다이어그램 파일은 주기적으로 삭제
+DIAGRAM_MAX_AGE_S = 30 * 60
+# 정리 시 남겨 둘 최대 파일 수 (초과분은 오래 사용되지 않은 파일부터 삭제)
+DIAGRAM_MAX_FILES = 100
+_diagram_dir_ready = False
+_diagram_dir_lock = threading.Lock()
+
+
+def _replace_atomically(path: str, write):
+    """
+    path와 같은 디렉토리의 고유한 임시 파일에 write(f)로 기록한 뒤 os.replace로 교체합니다.
+    같은 path에 동시에 쓰더라도 서로의 임시 파일을 건드리지 않고, 완성된 파일만 보입니다.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _ensure_diagram_dir() -> str:
+    """다이어그램 출력 디렉토리(및 링크)를 준비하고 정리 타이머를 시작합니다. 실제 출력 디렉토리를 반환합니다."""
+    global _diagram_dir_ready, DIAGRAM_OUTPUT_DIR
+    if _diagram_dir_ready:
+        return DIAGRAM_OUTPUT_DIR
+    with _diagram_dir_lock:
+        if not _diagram_dir_ready:
+            os.makedirs(DIAGRAM_OUTPUT_DIR, exist_ok=True)
+            if DIAGRAM_OUTPUT_DIR != DIAGRAM_LINK_DIR:
+                os.makedirs(os.path.dirname(DIAGRAM_LINK_DIR), exist_ok=True)
+                try:
+                    if not os.path.islink(DIAGRAM_LINK_DIR):
+                        os.symlink(DIAGRAM_OUTPUT_DIR, DIAGRAM_LINK_DIR)
+                except OSError as e:
+                    # 링크를 만들 수 없으면 (.temp/diagrams가 이미 실제 디렉토리인 경우 등) 디스크에 기록
+                    logger.warning(f"Cannot link {DIAGRAM_LINK_DIR} to tmpfs, writing diagrams to disk: {e}")
+                    DIAGRAM_OUTPUT_DIR = DIAGRAM_LINK_DIR
+                    os.makedirs(DIAGRAM_OUTPUT_DIR, exist_ok=True)
+            _schedule_diagram_cleanup()
+            _diagram_dir_ready = True
+    return DIAGRAM_OUTPUT_DIR
+
+
+def _schedule_diagram_cleanup():
+    timer = threading.Timer(DIAGRAM_MAX_AGE_S / 2, _cleanup_diagrams)
+    timer.daemon = True
+    timer.start()
+
+
+def _cleanup_diagrams():
+    """
+    DIAGRAM_MAX_AGE_S보다 오래된 다이어그램 파일과 DIAGRAM_MAX_FILES를 넘는 파일(수정 시각이 오래된 순)을
+    삭제하고 다음 정리를 예약합니다. 재사용된 파일은 수정 시각이 갱신되므로 LRU 순서가 됩니다.
+    """
+    cutoff = time.time() - DIAGRAM_MAX_AGE_S
+    try:
+        with os.scandir(DIAGRAM_OUTPUT_DIR) as entries:
+            files = []
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        files.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        files.sort(reverse=True)
+        for i, (mtime, path) in enumerate(files):
+            if mtime < cutoff or i >= DIAGRAM_MAX_FILES:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    except OSError as e:
+        logger.debug("Diagram cleanup failed: %s", e)
+    finally:
+        _schedule_diagram_cleanup()
+
+# diagrams 라이브러리와 같은 모양의 DOT 기본 속성
+_DOT_GRAPH_ATTRS = 'fontcolor="#2D3436" fontname="Sans-Serif" fontsize=15 nodesep=0.60 pad=2.0 rankdir=TB ranksep=0.75 splines=ortho'
+_DOT_NODE_ATTRS = 'fixedsize=true fontcolor="#2D3436" fontname="Sans-Serif" fontsize=13 height=1.4 imagescale=true labelloc=b shape=box style=rounded width=1.4'
+_DOT_EDGE_ATTRS = 'color="#7B8894" fontcolor="#2D3436" fontname="Sans-Serif" fontsize=13'
+_DOT_CLUSTER_ATTRS = 'bgcolor="#E5F5FD" fontname="Sans-Serif" fontsize=12 labeljust=l pencolor="#AEB6BE" rankdir=LR style=rounded'
+_DOT_ICON_HEIGHT = 1.9
+
+
+def _dot_quote(text) -> str:
+    """DOT 큰따옴표 문자열로 변환합니다 (역슬래시를 먼저 이스케이프해 끝의 역슬래시가 닫는 따옴표를 가리지 않도록 함)."""
+    return '"' + str(text).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+# 형식별 dot 렌더러 (svg:cairo는 노드 아이콘을 파일 경로 참조 대신 SVG 안에 포함)
+_DOT_RENDERERS = {'png': '-Tpng', 'svg': '-Tsvg:cairo'}
+
+# 미리 띄워 둔 dot 프로세스 수. 프로세스 시작/플러그인 로딩을 요청 경로 밖에서 끝내 두고 stdin으로 그래프를 전달
+DOT_WARM_PROCESSES = int(os.environ.get('DOT_WARM_PROCESSES', '4'))
+_DOT_WARM: 'queue.Queue[subprocess.Popen]' = queue.Queue()
+_DOT_WARM_LOCK = threading.Lock()
+
+
+def _spawn_dot() -> subprocess.Popen:
+    return subprocess.Popen(
+        ['dot', _DOT_RENDERERS[DIAGRAM_FORMAT]],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+
+
+_DOT_FORMAT_LOCK = threading.Lock()
+_dot_format_checked = False
+
+
+def _ensure_dot_format():
+    """설치된 Graphviz가 svg:cairo 렌더러를 지원하는지 최초 1회 확인하고, 없으면 경고 후 png로 대체합니다."""
+    global DIAGRAM_FORMAT, _dot_format_checked
+    if _dot_format_checked:
+        return
+    with _DOT_FORMAT_LOCK:
+        if _dot_format_checked:
+            return
+        if DIAGRAM_FORMAT == 'svg':
+            try:
+                result = subprocess.run(
+                    ['dot', _DOT_RENDERERS['svg']],
+                    input=b'digraph {}',
+                    capture_output=True,
+                    timeout=DOT_RENDER_TIMEOUT_S
+                )
+                if result.returncode != 0:
+                    logger.warning(
+                        "Graphviz does not support %s (%s); falling back to png diagrams",
+                        _DOT_RENDERERS['svg'], result.stderr.decode('utf-8', 'replace').strip()
+                    )
+                    DIAGRAM_FORMAT = 'png'
+            except (OSError, subprocess.TimeoutExpired) as e:
+                # dot 자체를 실행할 수 없으면 렌더링 단계에서 기존 오류 처리를 따름
+                logger.warning(f"Could not check Graphviz svg:cairo support: {e}")
+        _dot_format_checked = True
+
+
+def _take_dot_process() -> subprocess.Popen:
+    """대기 중인 dot 프로세스를 하나 꺼내고 (없으면 새로 실행) 풀 보충은 백그라운드 스레드에 맡깁니다."""
+    proc = None
+    try:
+        proc = _DOT_WARM.get_nowait()
+    except queue.Empty:
+        pass
+    if proc is None or proc.poll() is not None:
+        proc = _spawn_dot()
+    _schedule_dot_refill()
+    return proc
+
+
+# 풀 보충(dot 프로세스 실행)은 렌더링 스레드가 아닌 전용 스레드에서 수행 (대기 중인 보충 작업은 하나로 합침)
+DOT_REFILL_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dot-refill')
+_dot_refill_pending = False
+
+
+def _schedule_dot_refill():
+    global _dot_refill_pending
+    with _DOT_WARM_LOCK:
+        if _dot_refill_pending or _DOT_WARM.qsize() >= DOT_WARM_PROCESSES:
+            return
+        _dot_refill_pending = True
+    DOT_REFILL_POOL.submit(_refill_dot_pool)
+
+
+def _refill_dot_pool():
+    global _dot_refill_pending
+    try:
+        _fill_dot_pool()
+    except OSError as e:
+        logger.warning(f"Failed to pre-start dot processes: {e}")
+    finally:
+        with _DOT_WARM_LOCK:
+            _dot_refill_pending = False
+
+
+def _fill_dot_pool():
+    with _DOT_WARM_LOCK:
+        missing = DOT_WARM_PROCESSES - _DOT_WARM.qsize()
+    for _ in range(missing):
+        _DOT_WARM.put(_spawn_dot())
+
+# LLM 응답 캐시 유지 기간
+LLM_CACHE_EXPIRE_S = 7 * 24 * 60 * 60
+
+# 디스크 캐시 앞단의 프로세스 내 LRU 캐시 (최근 응답은 디스크 조회 없이 반환)
+LLM_MEMORY_CACHE_SIZE = 512
+_LLM_MEMORY_CACHE: 'OrderedDict[str, str]' = OrderedDict()
+_LLM_MEMORY_LOCK = threading.Lock()
+
+
+def _memory_cache_put(cache_key: str, content: str):
+    with _LLM_MEMORY_LOCK:
+        _LLM_MEMORY_CACHE[cache_key] = content
+        _LLM_MEMORY_CACHE.move_to_end(cache_key)
+        if len(_LLM_MEMORY_CACHE) > LLM_MEMORY_CACHE_SIZE:
+            _LLM_MEMORY_CACHE.popitem(last=False)
+
+# 다이어그램 구조 JSON Schema (structured outputs strict 모드: 선택 필드는 null 허용으로 표현)
+ARCHITECTURE_STRUCTURE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "components": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "service": {
+                        "type": "string",
+                        "enum": list(AZURE_SERVICE_NAMES),
+                        "description": "; ".join(f"{service_id}={name}" for service_id, name in AZURE_SERVICE_NAMES.items())
+                    },
+                    "label": {"type": "string"},
+                    "cluster": {"type": ["string", "null"]}
+                },
+                "required": ["id", "service", "label", "cluster"],
+                "additionalProperties": False
+            }
+        },
+        "connections": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "from": {"type": "string"},
+                    "to": {"type": "string"},
+                    "label": {"type": ["string", "null"]}
+                },
+                "required": ["from", "to", "label"],
+                "additionalProperties": False
+            }
+        },
+        "clusters": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "label": {"type": "string"}
+                },
+                "required": ["name", "label"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["title", "components", "connections", "clusters"],
+    "additionalProperties": False
+}
+
+ARCHITECTURE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "architecture_structure",
+        "strict": True,
+        "schema": ARCHITECTURE_STRUCTURE_SCHEMA
+    }
+}
+
+# 구조와 설명을 한 번의 요청으로 받을 때의 응답 형식
+ARCHITECTURE_WITH_DESCRIPTION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "architecture_structure_with_description",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "structure": ARCHITECTURE_STRUCTURE_SCHEMA,
+                "description": {"type": "string"}
+            },
+            "required": ["structure", "description"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# 여러 요구사항을 한 번에 분석할 때의 응답 형식 (요구사항 순서대로 구조 배열)
+ARCHITECTURE_BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "architecture_structure_batch",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "results": {"type": "array", "items": ARCHITECTURE_STRUCTURE_SCHEMA}
+            },
+            "required": ["results"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# 요구사항 임베딩 기반 구조 캐시 (ENABLE_SEMANTIC_CACHE=true일 때만 사용)
+ENABLE_SEMANTIC_CACHE = os.environ.get('ENABLE_SEMANTIC_CACHE', 'false').lower() == 'true'
+AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.environ.get('AZURE_OPENAI_EMBEDDING_DEPLOYMENT', 'text-embedding-3-small')
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.92'))
+SEMANTIC_CACHE_MAX_ENTRIES = 1000
+# 추가 후 디스크 저장까지 기다리는 시간 (그 사이의 추가는 한 번의 저장으로 합침)
+SEMANTIC_CACHE_SAVE_DELAY_S = 5.0
+
+
+# OpenAI 없이 수정할 때 사용하는 키워드 규칙: 요구사항(소문자)에 키워드가 있으면 해당 컴포넌트/클러스터 추가
+# 값: (컴포넌트 id, service, label, cluster, cluster label)
+_DATA_CLUSTER = ('data', 'Data Services')
+_NETWORK_CLUSTER = ('network', 'Network Services')
+_SECURITY_CLUSTER = ('security', 'Security Services')
+_BASIC_MODIFICATION_RULES = {
+    'database': ('database', 'sql_database', 'SQL Database', *_DATA_CLUSTER),
+    '데이터베이스': ('database', 'sql_database', 'SQL Database', *_DATA_CLUSTER),
+    'cosmos': ('cosmos_db', 'cosmos_db', 'Cosmos DB', *_DATA_CLUSTER),
+    '코스모스': ('cosmos_db', 'cosmos_db', 'Cosmos DB', *_DATA_CLUSTER),
+    'postgres': ('postgresql', 'postgresql', 'PostgreSQL', *_DATA_CLUSTER),
+    '포스트그레스': ('postgresql', 'postgresql', 'PostgreSQL', *_DATA_CLUSTER),
+    'storage': ('storage', 'blob_storage', 'Blob Storage', *_DATA_CLUSTER),
+    '스토리지': ('storage', 'blob_storage', 'Blob Storage', *_DATA_CLUSTER),
+    'cdn': ('cdn', 'cdn', 'CDN', *_NETWORK_CLUSTER),
+    'front door': ('front_door', 'front_door', 'Front Door', *_NETWORK_CLUSTER),
+    '프론트 도어': ('front_door', 'front_door', 'Front Door', *_NETWORK_CLUSTER),
+    'load balancer': ('load_balancer', 'load_balancer', 'Load Balancer', *_NETWORK_CLUSTER),
+    '로드 밸런서': ('load_balancer', 'load_balancer', 'Load Balancer', *_NETWORK_CLUSTER),
+    '부하 분산': ('load_balancer', 'load_balancer', 'Load Balancer', *_NETWORK_CLUSTER),
+    'firewall': ('firewall', 'firewall', 'Firewall', *_NETWORK_CLUSTER),
+    '방화벽': ('firewall', 'firewall', 'Firewall', *_NETWORK_CLUSTER),
+    'key vault': ('key_vault', 'key_vault', 'Key Vault', *_SECURITY_CLUSTER),
+    '키 자격 증명 모음': ('key_vault', 'key_vault', 'Key Vault', *_SECURITY_CLUSTER),
+    '키볼트': ('key_vault', 'key_vault', 'Key Vault', *_SECURITY_CLUSTER),
+    'service bus': ('service_bus', 'service_bus', 'Service Bus', 'integration', 'Integration Services'),
+    '서비스 버스': ('service_bus', 'service_bus', 'Service Bus', 'integration', 'Integration Services'),
+    'event hub': ('event_hubs', 'event_hubs', 'Event Hubs', 'integration', 'Integration Services'),
+    '이벤트 허브': ('event_hubs', 'event_hubs', 'Event Hubs', 'integration', 'Integration Services'),
+    'api management': ('api_management', 'api_management', 'API Management', 'integration', 'Integration Services'),
+    'openai': ('openai', 'openai', 'Azure OpenAI', 'ai', 'AI Services'),
+    'monitor': ('monitor', 'monitor', 'Azure Monitor', 'operations', 'Operations'),
+    '모니터링': ('monitor', 'monitor', 'Azure Monitor', 'operations', 'Operations'),
+}
+
+
+def _build_keyword_matcher(keywords):
+    """텍스트에 포함된 키워드 집합을 한 번의 스캔으로 찾는 함수를 반환합니다 (pyahocorasick 없으면 정규식 alternation)."""
+    if AHOCORASICK_AVAILABLE:
+        automaton = ahocorasick.Automaton()
+        for keyword in keywords:
+            automaton.add_word(keyword, keyword)
+        automaton.make_automaton()
+        return lambda text: {keyword for _, keyword in automaton.iter(text)}
+    pattern = re.compile('|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)))
+    return lambda text: set(pattern.findall(text))
+
+
+_match_modification_keywords = _build_keyword_matcher(_BASIC_MODIFICATION_RULES)
+
+
+# OpenAI 없이 생성하는 기본 설명 템플릿
+_DEFAULT_DESCRIPTION_TPL = string.Template("""# $title
+
+## 아키텍처 개요
+이 아키텍처는 Azure 클라우드 서비스를 활용한 현대적인 웹 애플리케이션 구조입니다.
+
+## 주요 구성 요소
+${components}
+## 특징
+- 높은 가용성과 확장성을 제공하는 클라우드 네이티브 아키텍처
+- Azure의 관리형 서비스를 활용한 운영 부담 최소화
+- 보안과 성능을 고려한 네트워크 구성
+""")
+
+
+@functools.lru_cache(maxsize=256)
+def _render_default_description(title: str, components: tuple) -> str:
+    """(label, service) 튜플 목록으로 기본 설명을 렌더링합니다 (같은 입력은 캐시된 결과 반환)."""
+    return _DEFAULT_DESCRIPTION_TPL.substitute(
+        title=title,
+        components=''.join(f"- **{label}**: {service} 서비스를 사용한 구성 요소\n" for label, service in components)
+    )
+
+
+# JSON 형식 보정 / Bicep 응답 파싱용 정규식
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+_BICEP_BLOCK = re.compile(r'```bicep\n(.*?)\n```', re.DOTALL)
+_BICEP_PARAM_BLOCK = re.compile(r'```bicepparam\n(.*?)\n```', re.DOTALL)
+
+
+def _unique_by_id(components: List[Dict[str, Any]], ids) -> List[Dict[str, Any]]:
+    """ids에 속한 컴포넌트를 id별 마지막 항목 기준으로 원래 순서대로 반환합니다 (id -> 컴포넌트 dict와 같은 의미)."""
+    by_id = {comp['id']: comp for comp in components if comp['id'] in ids}
+    return list(by_id.values())
+
+
+class SemanticCache:
+    """
+    요구사항 임베딩의 코사인 유사도로 이전 분석 결과(다이어그램 구조)를 찾는 캐시입니다.
+    정규화된 임베딩을 미리 할당한 float32 링 버퍼 행렬(최대 max_entries행)에 보관하고,
+    <path>.npy(행렬)와 <path>.json(요구사항/구조/다음 쓰기 위치)으로 저장합니다.
+    저장은 추가 후 SEMANTIC_CACHE_SAVE_DELAY_S 뒤에 백그라운드 타이머에서 한 번에 수행합니다.
+    """
+
+    def __init__(self, client, path: str, threshold: float = SEMANTIC_CACHE_THRESHOLD, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.client = client
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.matrix: Optional[np.ndarray] = None
+        self.requirements: List[Optional[str]] = [None] * max_entries
+        self.structures: List[Optional[str]] = [None] * max_entries
+        self.count = 0
+        self.next = 0
+        self._save_timer: Optional[threading.Timer] = None
+        self._load()
+
+    def _load(self):
+        try:
+            matrix = np.load(f"{self.path}.npy", allow_pickle=False)
+            with open(f"{self.path}.json", 'rb') as f:
+                meta = json_util.loads(f.read())
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Failed to load semantic cache: {e}")
+            return
+        count = meta['count']
+        if matrix.ndim != 2 or matrix.shape[0] != self.max_entries or count > self.max_entries:
+            logger.warning("Ignoring semantic cache saved with a different size")
+            return
+        self.matrix = matrix.astype(np.float32, copy=False)
+        self.requirements = meta['requirements']
+        self.structures = meta['structures']
+        self.count = count
+        self.next = meta['next']
+        logger.info(f"Loaded semantic cache: {self.count} entries")
+
+    def _schedule_save(self):
+        """락을 잡은 상태에서 호출합니다. 이미 예약된 저장이 있으면 그 저장에 합칩니다."""
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(SEMANTIC_CACHE_SAVE_DELAY_S, self._save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _save(self):
+        # 락 안에서는 스냅샷만 만들고, 파일 쓰기는 락 밖에서 수행 (조회가 저장을 기다리지 않도록)
+        with self.lock:
+            self._save_timer = None
+            matrix = self.matrix.copy()
+            meta = {
+                'count': self.count,
+                'next': self.next,
+                'requirements': list(self.requirements),
+                'structures': list(self.structures)
+            }
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            _replace_atomically(f"{self.path}.npy", lambda f: np.save(f, matrix, allow_pickle=False))
+            _replace_atomically(f"{self.path}.json", lambda f: f.write(json_util.dumpb(meta)))
+        except OSError as e:
+            logger.warning(f"Failed to save semantic cache: {e}")
+
+    def embed(self, text: str) -> np.ndarray:
+        """텍스트 임베딩 (단위 벡터로 정규화)"""
+        response = self.client.embeddings.create(model=AZURE_OPENAI_EMBEDDING_DEPLOYMENT, input=text)
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, query: np.ndarray) -> Union[Dict[str, Any], None]:
+        """유사도가 threshold 이상인 가장 가까운 항목의 구조를 반환합니다 (없으면 None)."""
+        with self.lock:
+            if self.matrix is None or not self.count or self.matrix.shape[1] != query.shape[0]:
+                return None
+            scores = self.matrix[:self.count] @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            logger.info(f"Semantic cache hit (score={scores[best]:.3f}): {self.requirements[best][:50]}")
+            structure = self.structures[best]
+        return json_util.loads(structure)
+
+    def add(self, query: np.ndarray, requirements: str, structure: Dict[str, Any]):
+        structure_json = json_util.dumps(structure)
+        with self.lock:
+            if self.matrix is None or self.matrix.shape[1] != query.shape[0]:
+                # 첫 추가(또는 임베딩 차원 변경) 시 링 버퍼 할당
+                self.matrix = np.zeros((self.max_entries, query.shape[0]), dtype=np.float32)
+                self.requirements = [None] * self.max_entries
+                self.structures = [None] * self.max_entries
+                self.count = 0
+                self.next = 0
+            # 가장 오래된 행을 덮어씀
+            self.matrix[self.next] = query
+            self.requirements[self.next] = requirements
+            self.structures[self.next] = structure_json
+            self.next = (self.next + 1) % self.max_entries
+            self.count = min(self.count + 1, self.max_entries)
+            self._schedule_save()
+
+
+class StructureBatcher:
+    """
+    짧은 시간 안에 들어온 구조 분석 요청을 모아 한 번에 처리하는 마이크로 배처입니다.
+    요청이 하나뿐이면 analyze_one(단건 캐시 경로)을, 여럿이면 analyze_many(일괄 요청)를 호출합니다.
+    """
+
+    def __init__(self, analyze_one, analyze_many, window_s: float, max_size: int = ARCHITECTURE_BATCH_MAX):
+        self.analyze_one = analyze_one
+        self.analyze_many = analyze_many
+        self.window_s = window_s
+        self.max_size = max_size
+        self.queue: 'queue.Queue[tuple]' = queue.Queue()
+        # 수집 스레드가 LLM 응답을 기다리지 않고 다음 배치를 모을 수 있도록 호출은 별도 풀에서 실행
+        self.pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='structure-batch')
+        threading.Thread(target=self._collect, name='structure-batcher', daemon=True).start()
+
+    def submit(self, requirements: str) -> 'Future[Dict[str, Any]]':
+        future = Future()
+        self.queue.put((requirements, future))
+        return future
+
+    def _collect(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.window_s
+            while len(batch) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.pool.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        try:
+            if len(batch) == 1:
+                structures = [self.analyze_one(batch[0][0])]
+            else:
+                logger.info(f"Dispatching batched structure analysis: {len(batch)} requirements")
+                structures = self.analyze_many([requirements for requirements, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), structure in zip(batch, structures):
+            future.set_result(structure)
+
+
 class ArchitectureDiagramService:
     
+    # 서비스 id -> 노드 아이콘 이미지 경로 (DOT image 속성에 사용, _ensure_service_icons가 diagrams 패키지에서 조회해 채움)
+    service_icons: Mapping[str, str] = types.MappingProxyType({})
+    
     # Azure 서비스 목록 상수
-    AZURE_SERVICES_DESCRIPTION = """사용 가능한 Azure 서비스들:
-        - app_service: Azure App Service (웹 애플리케이션)
-        - function_app: Azure Functions (서버리스 함수)
-        - container_instances: Azure Container Instances
-        - virtual_machines: Azure Virtual Machines
-        - container_apps: Azure Container Apps
-        - kubernetes_services: Azure Kubernetes Services
-        - postgresql: Azure Database for PostgreSQL
-        - cosmos_db: Azure Cosmos DB
-        - sql_database: Azure SQL Database
-        - storage_account: Azure Storage Account
-        - blob_storage: Azure Blob Storage
-        - load_balancer: Azure Load Balancer
-        - application_gateway: Azure Application Gateway
-        - cdn: Azure CDN
-        - virtual_network: Azure Virtual Network
-        - subnet: Azure Subnet
-        - firewall: Azure Firewall
-        - front_door: Azure Front Door
-        - application_security_group: Azure Application Security Group
-        - api_management: Azure API Management
-        - service_bus: Azure Service Bus
-        - event_hubs: Azure Event Hubs
-        - logic_apps: Azure Logic Apps
-        - synapse: Azure Synapse Analytics
-        - data_factory: Azure Data Factory
-        - ml_workspace: Azure Machine Learning
-        - cognitive_services: Azure Cognitive Services
-        - openai: Azure OpenAI
-        - monitor: Azure Monitor
-        - key_vault: Azure Key Vault
-        - security_center: Azure Security Center
-        - devops: Azure DevOps
-        - users: Users/Clients"""
+    AZURE_SERVICE_IDS = list(AZURE_SERVICE_NAMES)
+    AZURE_SERVICES_DESCRIPTION = AZURE_SERVICES_DESCRIPTION
     
-    def __init__(self):
-        self.azure_openai = None
-        if azure_openai_endpoint and azure_openai_api_key:
-            self.azure_openai = AzureOpenAI(
-                azure_endpoint=azure_openai_endpoint,
-                api_version='2024-06-01',
-                api_key=azure_openai_api_key
+    def __init__(self, config: AzureConfig = AZURE_CONFIG):
+        self.azure_openai = azure_openai if config is AZURE_CONFIG else _create_client(config)
+        self._model = config.deployment
+        self._structure_model = config.structure_deployment
+        _start_keepalive()
+        
+        # LLM 응답 캐시 (diskcache 설치 시 diskcache, 아니면 SQLite 파일; 둘 다 프로세스 재시작 후에도 유지)
+        if DISKCACHE_AVAILABLE:
+            self.llm_cache = diskcache.Cache(os.path.join(os.getcwd(), '.temp', 'llm_cache'))
+        else:
+            self.llm_cache = SqliteTTLCache(os.path.join(os.getcwd(), '.temp', 'llm_cache.sqlite3'), LLM_CACHE_EXPIRE_S)
+        
+        self.semantic_cache = None
+        if ENABLE_SEMANTIC_CACHE and self.azure_openai:
+            self.semantic_cache = SemanticCache(self.azure_openai, os.path.join(os.getcwd(), '.temp', 'semantic_cache'))
+        
+        self.structure_batcher = None
+        if ARCHITECTURE_BATCH_WINDOW_MS > 0 and self.azure_openai:
+            self.structure_batcher = StructureBatcher(
+                self._analyze_requirements_with_openai,
+                self._analyze_requirements_batch_with_openai,
+                ARCHITECTURE_BATCH_WINDOW_MS / 1000
             )
-        
-        # Azure 서비스 매핑
-        self.azure_services_map = {
-            'app_service': AppServices,
-            'function_app': FunctionApps,
-            'container_instances': ContainerInstances,
-            'container_apps': ContainerApps,
-            'kubernetes_services': KubernetesServices,
-            'virtual_machines': VM,
-            'postgresql': DatabaseForPostgresqlServers,
-            'cosmos_db': CosmosDb,
-            'sql_database': SQLDatabases,
-            'storage_account': StorageAccounts,
-            'blob_storage': BlobStorage,
-            'load_balancer': LoadBalancers,
-            'application_gateway': ApplicationGateway,
-            'cdn': CDNProfiles,
-            'firewall': Firewall,
-            'front_door': FrontDoors,
-            'application_security_group': ApplicationSecurityGroups,
-            'virtual_network': VirtualNetworks,
-            'subnet': Subnets,
-            'api_management': APIManagement,
-            'service_bus': ServiceBus,
-            'event_hubs': EventHubs,
-            'logic_apps': LogicApps,
-            'synapse': SynapseAnalytics,
-            'data_factory': DataFactories,
-            'ml_workspace': MachineLearningServiceWorkspaces,
-            'cognitive_services': CognitiveServices,
-            'openai': OpenAI,
-            'key_vault': KeyVaults,
-            'security_center': SecurityCenter,
-            'devops': Devops,
-            'users': Users,
-            'monitor': Monitor
-        }
     
     def _fix_json_format(self, json_str: str) -> str:
         """
@@ -120,13 +877,11 @@ class ArchitectureDiagramService:
         - 단일 따옴표를 이중 따옴표로 변경
         - 후행 쉼표 제거
         """
-        import re
-        
         # 단일 따옴표를 이중 따옴표로 변경
         fixed_json = json_str.replace("'", '"')
         
         # 후행 쉼표 제거
-        fixed_json = re.sub(r',(\s*[}\]])', r'\1', fixed_json)
+        fixed_json = _TRAILING_COMMA.sub(r'\1', fixed_json)
         
         return fixed_json
     
@@ -135,80 +890,186 @@ class ArchitectureDiagramService:
         JSON 문자열을 안전하게 파싱합니다. 실패시 형식 수정을 시도합니다.
         """
         try:
-            return json.loads(json_str)
+            return json_util.loads(json_str)
         except json.JSONDecodeError as e:
             logger.warning(f"Failed to parse JSON in {context}: {e}")
             try:
                 fixed_json = self._fix_json_format(json_str)
-                result = json.loads(fixed_json)
+                result = json_util.loads(fixed_json)
                 logger.info(f"Successfully parsed JSON in {context} after fixing format issues")
                 return result
             except json.JSONDecodeError as e2:
                 logger.error(f"Still failed to parse JSON in {context} after fixing: {e2}")
                 raise e2
     
-    def _process_stream_response(self, stream_response) -> str:
+    def _cache_key(self, system_prompt: str, user_prompt: str, options: Dict[str, Any]) -> str:
+        """배포 이름/프롬프트/옵션 기준 LLM 응답 캐시 키"""
+        return hashlib.sha256('\x00'.join((
+            self._model or '',
+            system_prompt,
+            user_prompt,
+            json_util.dumpb_sorted(options).decode('utf-8')
+        )).encode('utf-8')).hexdigest()
+    
+    def _cache_get(self, cache_key: str) -> Optional[str]:
+        """메모리 LRU → 디스크 캐시 순으로 조회합니다 (디스크 적중 시 메모리로 올림)."""
+        with _LLM_MEMORY_LOCK:
+            cached = _LLM_MEMORY_CACHE.get(cache_key)
+            if cached is not None:
+                _LLM_MEMORY_CACHE.move_to_end(cache_key)
+                return cached
+        cached = self.llm_cache.get(cache_key)
+        if cached is not None:
+            _memory_cache_put(cache_key, cached)
+        return cached
+    
+    def _cache_set_if_complete(self, cache_key: str, content: str, finish_reason: Optional[str], response_format: Optional[Dict[str, Any]]):
         """
-        스트림 응답을 처리하여 완전한 응답 텍스트를 반환합니다.
-        
-        Args:
-            stream_response: Azure OpenAI 스트림 응답 객체
-            
-        Returns:
-            str: 완전한 응답 텍스트
+        정상 종료(finish_reason == 'stop')된 비어 있지 않은 응답만 캐시합니다.
+        json_schema 응답은 파싱까지 성공해야 저장합니다 (잘린/필터링된 응답이 캐시에 남아 재요청을 막지 않도록).
         """
-        full_content = ""
-        try:
-            for chunk in stream_response:
-                if chunk.choices and len(chunk.choices) > 0:
-                    delta = chunk.choices[0].delta
-                    if hasattr(delta, 'content') and delta.content is not None:
-                        full_content += delta.content
-                        # 실시간 로그 출력 (선택사항)
-                        logger.debug(f"Stream chunk: {delta.content}")
-            return full_content
-        except Exception as e:
-            logger.error(f"Error processing stream response: {e}")
-            raise e
+        if finish_reason != 'stop' or not content:
+            logger.warning(f"Not caching LLM response: finish_reason={finish_reason}, length={len(content)}")
+            return
+        if response_format and response_format.get('type') == 'json_schema':
+            try:
+                json_util.loads(content)
+            except ValueError as e:
+                logger.warning(f"Not caching unparseable structured response: {e}")
+                return
+        self._cache_set(cache_key, content)
     
-    def generate_architecture_diagram(self, requirements: str) -> Dict[str, Any]:
+    def _cache_set(self, cache_key: str, content: str):
+        _memory_cache_put(cache_key, content)
+        if DISKCACHE_AVAILABLE:
+            self.llm_cache.set(cache_key, content, expire=LLM_CACHE_EXPIRE_S)
+        else:
+            self.llm_cache.set(cache_key, content)
+    
+    def _create_completion(self, system_prompt: str, user_prompt: str, stream: bool, **kwargs):
+        prefix = _SYSTEM_MESSAGE_PREFIXES.get(system_prompt) or [{"role": "system", "content": system_prompt}]
+        kwargs.setdefault('model', self._model)
+        return self.azure_openai.chat.completions.create(
+            messages=prefix + [{"role": "user", "content": user_prompt}],
+            stream=stream,
+            **kwargs
+        )
+    
+    def _complete(self, system_prompt: str, user_prompt: str, **kwargs) -> str:
+        """
+        Chat completion을 호출하고 전체 응답 텍스트를 반환합니다 (호출자가 전체 응답을 기다리므로 스트리밍하지 않음).
+        동일한 프롬프트/배포/옵션에 대해서는 캐시된 응답을 반환합니다.
+        """
+        cache_key = self._cache_key(system_prompt, user_prompt, kwargs)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            logger.info(f"LLM cache hit: {cache_key[:12]}")
+            return cached
+        
+        response = self._create_completion(system_prompt, user_prompt, stream=False, **kwargs)
+        choice = response.choices[0]
+        response_format = kwargs.get('response_format')
+        if choice.finish_reason == 'length' and response_format and response_format.get('type') == 'json_schema':
+            # max_tokens에서 잘린 구조화 응답은 파싱할 수 없으므로 상한을 두 배로 올려 한 번만 재시도
+            max_tokens = kwargs.get('max_tokens') or STRUCTURE_COMPLETION_OPTIONS['max_tokens']
+            logger.warning(f"Structured response truncated at max_tokens={max_tokens}, retrying with {max_tokens * 2}")
+            response = self._create_completion(system_prompt, user_prompt, stream=False, **{**kwargs, 'max_tokens': max_tokens * 2})
+            choice = response.choices[0]
+            if choice.finish_reason == 'length':
+                # 호출자가 기본 구조로 폴백하도록 예외 발생 (잘린 응답은 캐시하지 않음)
+                raise ValueError(f"Structured response truncated at max_tokens={max_tokens * 2}")
+        content = choice.message.content or ''
+        self._cache_set_if_complete(cache_key, content, choice.finish_reason, kwargs.get('response_format'))
+        return content
+    
+    def _complete_stream(self, system_prompt: str, user_prompt: str, **kwargs) -> Iterator[str]:
+        """
+        _complete의 스트리밍 버전입니다. 요청은 호출 즉시 시작되며,
+        응답 텍스트 조각을 순서대로 반환하는 iterator를 돌려줍니다. 완료된 응답은 캐시에 저장합니다.
+        """
+        cache_key = self._cache_key(system_prompt, user_prompt, kwargs)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            logger.info(f"LLM cache hit: {cache_key[:12]}")
+            return iter((cached,))
+        
+        return self._iter_stream_and_cache(
+            self._create_completion(system_prompt, user_prompt, stream=True, **kwargs),
+            cache_key,
+            kwargs.get('response_format')
+        )
+    
+    def _iter_stream_and_cache(self, stream_response, cache_key: str, response_format: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        parts = []
+        finish_reason = None
+        for chunk in stream_response:
+            if chunk.choices:
+                choice = chunk.choices[0]
+                content = choice.delta.content
+                if content:
+                    parts.append(content)
+                    yield content
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+        self._cache_set_if_complete(cache_key, ''.join(parts), finish_reason, response_format)
+    
+    def generate_architecture_diagram(self, requirements: str, include_description: bool = True, include_diagram: bool = True) -> Dict[str, Any]:
         """
         아키텍처 요구사항을 받아서 Azure Architecture Diagram을 생성합니다.
         
         Args:
             requirements: 자연어로 작성된 아키텍처 요구사항
+            include_description: False이면 설명 생성 LLM 호출을 생략 (description=None)
+            include_diagram: False이면 다이어그램 렌더링을 생략 (diagram_path=None)
             
         Returns:
             Dict containing diagram path and description
         """
         logger.info("Starting diagram generation")
-        logger.debug(f"Requirements: {requirements}")
+        logger.debug("Requirements: %s", requirements)
+        
+        if include_diagram:
+            self._prepare_rendering()
         
         try:
             # OpenAI를 사용하여 요구사항을 분석하고 다이어그램 구조 생성
-            logger.info("Analyzing requirements with OpenAI")
-            diagram_structure = self._analyze_requirements_with_openai(requirements)
-            logger.debug(f"OpenAI analysis completed: {diagram_structure}")
+            description = None
+            if include_description and ARCHITECTURE_COMBINED_COMPLETION and self.azure_openai:
+                logger.info("Analyzing requirements and generating description in one request")
+                diagram_structure, description = self._analyze_and_describe_with_openai(requirements)
+            else:
+                logger.info("Analyzing requirements with OpenAI")
+                diagram_structure = self._analyze_requirements(requirements)
+            logger.debug("OpenAI analysis completed: %s", diagram_structure)
             
-            # 다이어그램 생성
-            logger.info("Creating diagram")
-            diagram_path = self._create_diagram(diagram_structure)
-            logger.info(f"Diagram created at: {diagram_path}")
+            # 다이어그램 생성 (설명 생성과 병렬로 실행)
+            diagram_future = None
+            if include_diagram:
+                logger.info("Creating diagram")
+                diagram_future = DIAGRAM_POOL.submit(self._create_diagram, diagram_structure)
             
             # 상세 설명 생성
-            logger.info("Generating description")
-            description = self._generate_description(diagram_structure, requirements)
-            logger.debug(f"Description generated, length: {len(description) if description else 0}")
+            if include_description and description is None:
+                logger.info("Generating description")
+                description = self._generate_description(diagram_structure, requirements)
+                logger.debug("Description generated, length: %s", len(description) if description else 0)
+            
+            diagram_path = None
+            if diagram_future is not None:
+                diagram_path = diagram_future.result()
+                logger.info(f"Diagram created at: {diagram_path}")
             
             # 다이어그램과 설명을 포함한 포맷된 응답 생성
-            formatted_description = self._format_description_with_diagram(description, diagram_path)
+            formatted_description = description
+            if description is not None and diagram_path is not None:
+                formatted_description = self._format_description_with_diagram(description, diagram_path)
             
             result = {
                 'success': True,
                 'diagram_path': diagram_path,
                 'description': formatted_description,
                 'structure': diagram_structure,
-                'diagram_tag': f'<DIAGRAM>{diagram_path}</DIAGRAM>'
+                'diagram_tag': f'<DIAGRAM>{diagram_path}</DIAGRAM>' if diagram_path else None
             }
             
             logger.info("Diagram generation completed successfully")
@@ -225,6 +1086,114 @@ class ArchitectureDiagramService:
                 'description': None
             }
     
+    def generate_batch(self, reqs: List[str]) -> List[Dict[str, Any]]:
+        """
+        여러 아키텍처 요구사항을 한 번의 OpenAI 요청으로 분석하고 다이어그램을 병렬로 생성합니다.
+        
+        Returns:
+            요구사항 순서대로 {'success', 'diagram_path', 'structure', 'diagram_tag'} (실패 시 'error') 목록
+        """
+        if not reqs:
+            return []
+        
+        logger.info(f"Starting batch diagram generation: {len(reqs)} requirements")
+        structures = self._analyze_requirements_batch_with_openai(reqs)
+        diagram_futures = [DIAGRAM_POOL.submit(self._create_diagram, structure) for structure in structures]
+        
+        results = []
+        for structure, diagram_future in zip(structures, diagram_futures):
+            try:
+                diagram_path = diagram_future.result()
+                results.append({
+                    'success': True,
+                    'diagram_path': diagram_path,
+                    'structure': structure,
+                    'diagram_tag': f'<DIAGRAM>{diagram_path}</DIAGRAM>'
+                })
+            except Exception as e:
+                logger.exception(f"Error during batch diagram creation: {str(e)}")
+                results.append({
+                    'success': False,
+                    'error': str(e),
+                    'diagram_path': None,
+                    'structure': structure
+                })
+        return results
+    
+    def stream_architecture_diagram(self, requirements: str) -> Iterator[Union[Dict[str, Any], str]]:
+        """
+        generate_architecture_diagram의 스트리밍 버전입니다.
+        
+        첫 항목으로 {'diagram_path', 'structure', 'diagram_tag'} dict를 반환하고,
+        이후 설명 텍스트 조각을 생성되는 대로 반환합니다. 설명 요청은 다이어그램 렌더링과 동시에 시작됩니다.
+        """
+        logger.info("Starting streamed diagram generation")
+        self._prepare_rendering()
+        diagram_structure = self._analyze_requirements(requirements)
+        diagram_future = DIAGRAM_POOL.submit(self._create_diagram, diagram_structure)
+        description_chunks = self._stream_description(diagram_structure, requirements)
+        
+        diagram_path = diagram_future.result()
+        logger.info(f"Diagram created at: {diagram_path}")
+        yield {
+            'diagram_path': diagram_path,
+            'structure': diagram_structure,
+            'diagram_tag': f'<DIAGRAM>{diagram_path}</DIAGRAM>'
+        }
+        yield from description_chunks
+    
+    def stream_modified_architecture_diagram(self, structure_json: Union[str, Dict[str, Any]], requirements: str) -> Iterator[Union[Dict[str, Any], str]]:
+        """modify_architecture_diagram의 스트리밍 버전입니다. 반환 형식은 stream_architecture_diagram과 같습니다."""
+        previous_structure_dict = self._parse_previous_structure(structure_json)
+        if previous_structure_dict is None:
+            yield from self.stream_architecture_diagram(requirements)
+            return
+        
+        logger.info("Starting streamed architecture modification")
+        self._prepare_rendering()
+        modified_structure = self._analyze_modification_with_openai(previous_structure_dict, requirements)
+        diagram_future = DIAGRAM_POOL.submit(self._create_diagram, modified_structure)
+        description_chunks = self._stream_modification_description(previous_structure_dict, modified_structure, requirements)
+        
+        diagram_path = diagram_future.result()
+        logger.info(f"Modified diagram created at: {diagram_path}")
+        yield {
+            'diagram_path': diagram_path,
+            'structure': modified_structure,
+            'diagram_tag': f'<DIAGRAM>{diagram_path}</DIAGRAM>'
+        }
+        yield from description_chunks
+    
+    def _parse_previous_structure(self, structure_json: Union[str, Dict[str, Any]]) -> Union[Dict[str, Any], None]:
+        """기존 구조를 dict로 변환합니다. 비어 있거나 파싱할 수 없으면 None (새로 생성)"""
+        if not structure_json:
+            logger.info("Structure JSON is empty, generating new architecture")
+            return None
+        
+        # structure_json이 이미 dict인 경우와 string인 경우 모두 처리
+        if isinstance(structure_json, dict):
+            logger.debug("Using existing dict structure: %s", structure_json)
+            return structure_json
+        
+        if isinstance(structure_json, str):
+            # 문자열인 경우 strip() 체크 후 파싱
+            if structure_json.strip() == "":
+                logger.info("Structure JSON string is empty, generating new architecture")
+                return None
+            
+            try:
+                previous_structure_dict = self._parse_json_safely(structure_json, "previous structure")
+                logger.debug("Parsed previous structure: %s", previous_structure_dict)
+                return previous_structure_dict
+            except json.JSONDecodeError as e:
+                logger.warning(f"Failed to parse structure JSON even after fixing: {e}")
+                logger.info("Falling back to new architecture generation")
+                return None
+        
+        logger.warning(f"Invalid structure_json type: {type(structure_json)}")
+        logger.info("Falling back to new architecture generation")
+        return None
+    
     def modify_architecture_diagram(self, structure_json: Union[str, Dict[str, Any]], requirements: str) -> Dict[str, Any]:
         """
         기존 아키텍처를 수정하는 기능입니다.
@@ -237,52 +1206,32 @@ class ArchitectureDiagramService:
             Dict containing modified diagram path and description (generate_architecture_diagram과 동일한 형태)
         """
         logger.info("Starting architecture modification")
-        logger.debug(f"Structure JSON: {structure_json}")
-        logger.debug(f"Requirements: {requirements}")
+        logger.debug("Structure JSON: %s", structure_json)
+        logger.debug("Requirements: %s", requirements)
         
         try:
-            # 기존 구조가 비어있는 경우 새로 생성
-            if not structure_json:
-                logger.info("Structure JSON is empty, generating new architecture")
-                return self.generate_architecture_diagram(requirements)
-            
-            # structure_json이 이미 dict인 경우와 string인 경우 모두 처리
-            if isinstance(structure_json, dict):
-                # 이미 딕셔너리인 경우
-                previous_structure_dict = structure_json
-                logger.debug(f"Using existing dict structure: {previous_structure_dict}")
-            elif isinstance(structure_json, str):
-                # 문자열인 경우 strip() 체크 후 파싱
-                if structure_json.strip() == "":
-                    logger.info("Structure JSON string is empty, generating new architecture")
-                    return self.generate_architecture_diagram(requirements)
-                
-                try:
-                    previous_structure_dict = self._parse_json_safely(structure_json, "previous structure")
-                    logger.debug(f"Parsed previous structure: {previous_structure_dict}")
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Failed to parse structure JSON even after fixing: {e}")
-                    logger.info("Falling back to new architecture generation")
-                    return self.generate_architecture_diagram(requirements)
-            else:
-                logger.warning(f"Invalid structure_json type: {type(structure_json)}")
-                logger.info("Falling back to new architecture generation")
+            # 기존 구조가 비어 있거나 파싱할 수 없으면 새로 생성
+            previous_structure_dict = self._parse_previous_structure(structure_json)
+            if previous_structure_dict is None:
                 return self.generate_architecture_diagram(requirements)
             
             # OpenAI를 사용하여 기존 구조와 요구사항을 분석하고 수정된 다이어그램 구조 생성
+            self._prepare_rendering()
             logger.info("Analyzing modification requirements with OpenAI")
             modified_structure = self._analyze_modification_with_openai(previous_structure_dict, requirements)
-            logger.debug(f"OpenAI modification analysis completed: {modified_structure}")
+            logger.debug("OpenAI modification analysis completed: %s", modified_structure)
             
-            # 수정된 다이어그램 생성
+            # 수정된 다이어그램 생성 (설명 생성과 병렬로 실행)
             logger.info("Creating modified diagram")
-            diagram_path = self._create_diagram(modified_structure)
-            logger.info(f"Modified diagram created at: {diagram_path}")
+            diagram_future = DIAGRAM_POOL.submit(self._create_diagram, modified_structure)
             
             # 수정에 대한 상세 설명 생성
             logger.info("Generating modification description")
             description = self._generate_modification_description(previous_structure_dict, modified_structure, requirements)
-            logger.debug(f"Modification description generated, length: {len(description) if description else 0}")
+            logger.debug("Modification description generated, length: %s", len(description) if description else 0)
+            
+            diagram_path = diagram_future.result()
+            logger.info(f"Modified diagram created at: {diagram_path}")
             
             # 다이어그램과 설명을 포함한 포맷된 응답 생성
             formatted_description = self._format_description_with_diagram(description, diagram_path)
@@ -309,42 +1258,17 @@ class ArchitectureDiagramService:
                 'description': None
             }
     
+    def _analyze_requirements(self, requirements: str) -> Dict[str, Any]:
+        """요구사항을 분석합니다 (배처가 켜져 있으면 동시 요청과 묶어서 처리)."""
+        if self.structure_batcher is None:
+            return self._analyze_requirements_with_openai(requirements)
+        return self.structure_batcher.submit(requirements).result()
+    
     def _analyze_requirements_with_openai(self, requirements: str) -> Dict[str, Any]:
         """OpenAI를 사용하여 요구사항을 분석하고 다이어그램 구조를 생성합니다."""
         
-        system_prompt = f"""
-        당신은 Azure 아키텍처 전문가입니다. 사용자의 요구사항을 분석하여 Azure 서비스를 사용한 아키텍처 다이어그램 구조를 JSON으로 생성해주세요.
-
-        {self.AZURE_SERVICES_DESCRIPTION}
-
-        JSON 응답 형식:
-        {{
-            "title": "다이어그램 제목",
-            "components": [
-                {{
-                    "id": "component_id",
-                    "service": "service_name",
-                    "label": "Component Label",
-                    "cluster": "cluster_name" (선택사항)
-                }}
-            ],
-            "connections": [
-                {{
-                    "from": "component_id1",
-                    "to": "component_id2",
-                    "label": "connection_label" (선택사항)
-                }}
-            ],
-            "clusters": [
-                {{
-                    "name": "cluster_name",
-                    "label": "Cluster Label"
-                }}
-            ]
-        }}
-        """
-        
-        user_prompt = f"다음 아키텍처 요구사항을 분석하여 Azure 다이어그램 구조를 JSON으로 생성해주세요:\n\n{requirements}"
+        system_prompt = _ANALYZE_SYS_PROMPT
+        user_prompt = requirements
         
         logger.debug("Checking OpenAI configuration")
         if not self.azure_openai:
@@ -352,128 +1276,89 @@ class ArchitectureDiagramService:
             logger.warning("OpenAI not configured, using default structure")
             return self._get_default_structure()
         
+        # 의미상 비슷한 요구사항을 이미 분석했다면 chat 호출 생략
+        query = None
+        if self.semantic_cache:
+            try:
+                query = self.semantic_cache.embed(requirements)
+                cached = self.semantic_cache.lookup(query)
+                if cached is not None:
+                    return cached
+            except Exception as e:
+                logger.warning(f"Semantic cache lookup failed: {e}")
+        
         try:
             logger.debug("Calling OpenAI API for requirements analysis")
-            stream_response = self.azure_openai.chat.completions.create(
-                model=azure_openai_deployment_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                stream=True
-            )
+            content = self._complete(system_prompt, user_prompt, response_format=ARCHITECTURE_RESPONSE_FORMAT, model=self._structure_model, **STRUCTURE_COMPLETION_OPTIONS)
+            logger.debug("OpenAI response content: %s", content)
             
-            logger.debug("OpenAI API call completed, processing stream")
-            content = self._process_stream_response(stream_response)
-            logger.debug(f"OpenAI response content: {content}")
-            
-            # JSON 추출 - 더 견고한 방법으로 개선
-            try:
-                # 여러 방법으로 JSON 추출 시도
-                json_str = None
-                
-                # 방법 1: 첫 번째 { 부터 마지막 } 까지
-                start_idx = content.find('{')
-                if start_idx != -1:
-                    # 중괄호 매칭을 사용하여 올바른 JSON 끝 찾기
-                    brace_count = 0
-                    end_idx = start_idx
-                    for i, char in enumerate(content[start_idx:], start_idx):
-                        if char == '{':
-                            brace_count += 1
-                        elif char == '}':
-                            brace_count -= 1
-                            if brace_count == 0:
-                                end_idx = i + 1
-                                break
-                    json_str = content[start_idx:end_idx]
-                
-                # 방법 2: JSON 코드 블록 찾기
-                if not json_str or json_str == '{}':
-                    import re
-                    json_match = re.search(r'```json\s*(\{.*?\})\s*```', content, re.DOTALL)
-                    if json_match:
-                        json_str = json_match.group(1)
-                
-                # 방법 3: 백틱 없는 JSON 블록
-                if not json_str or json_str == '{}':
-                    json_match = re.search(r'(\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\})', content, re.DOTALL)
-                    if json_match:
-                        json_str = json_match.group(1)
-                
-                if not json_str:
-                    logger.error("Could not extract JSON from OpenAI response")
-                    logger.error(f"Response content: {content}")
-                    return self._get_default_structure()
-                
-                logger.debug(f"Extracted JSON: {json_str}")
-                
-                # JSON 파싱 시도
-                result = self._parse_json_safely(json_str, "OpenAI response")
-                logger.debug(f"Parsed JSON structure: {result}")
-                return result
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse extracted JSON even after fixing: {e}")
-                logger.error(f"Problematic JSON: {json_str}")
-                logger.error(f"Full OpenAI response: {content}")
-                return self._get_default_structure()
+            # response_format으로 스키마가 보장되므로 그대로 파싱
+            result = json_util.loads(content)
+            if query is not None:
+                self.semantic_cache.add(query, requirements, result)
+            return result
             
         except Exception as e:
             logger.exception(f"OpenAI 분석 오류: {e}")
             logger.info("Falling back to default structure")
             return self._get_default_structure()
     
-    def _analyze_modification_with_openai(self, previous_structure: Dict[str, Any], requirements: str) -> Dict[str, Any]:
-        """OpenAI를 사용하여 기존 아키텍처 구조를 분석하고 변경 요구사항에 따라 수정된 구조를 생성합니다."""
-        
-        system_prompt = f"""
-        당신은 Azure 아키텍처 전문가입니다. 기존 아키텍처 구조와 변경 요구사항을 분석하여 수정된 Azure 아키텍처 다이어그램 구조를 JSON으로 생성해주세요.
-
-        {self.AZURE_SERVICES_DESCRIPTION}
-
-        변경 요구사항을 기존 아키텍처에 적용하여 수정된 구조를 생성해주세요.
-        - 기존 구성 요소들을 최대한 유지하면서 필요한 변경사항만 적용
-        - 새로운 구성 요소가 필요하면 추가
-        - 불필요한 구성 요소가 있으면 제거
-        - 연결 관계도 요구사항에 맞게 수정
-
-        JSON 응답 형식:
-        {{
-            "title": "다이어그램 제목",
-            "components": [
-                {{
-                    "id": "component_id",
-                    "service": "service_name",
-                    "label": "Component Label",
-                    "cluster": "cluster_name" (선택사항)
-                }}
-            ],
-            "connections": [
-                {{
-                    "from": "component_id1",
-                    "to": "component_id2",
-                    "label": "connection_label" (선택사항)
-                }}
-            ],
-            "clusters": [
-                {{
-                    "name": "cluster_name",
-                    "label": "Cluster Label"
-                }}
-            ]
-        }}
-        """
+    def _analyze_and_describe_with_openai(self, requirements: str):
+        """구조와 설명을 한 번의 요청으로 생성합니다. 실패 시 구조/설명을 각각 따로 생성하는 경로로 폴백합니다."""
+        try:
+            content = self._complete(
+                _ANALYZE_AND_DESCRIBE_SYS_PROMPT,
+                requirements,
+                response_format=ARCHITECTURE_WITH_DESCRIPTION_RESPONSE_FORMAT,
+                **{
+                    **STRUCTURE_COMPLETION_OPTIONS,
+                    'model': self._model,
+                    'max_tokens': STRUCTURE_COMPLETION_OPTIONS['max_tokens'] + DESCRIPTION_COMPLETION_OPTIONS['max_tokens']
+                }
+            )
+            result = json_util.loads(content)
+            return result['structure'], result['description']
+        except Exception as e:
+            logger.exception(f"OpenAI 통합 분석 오류: {e}")
+            structure = self._analyze_requirements_with_openai(requirements)
+            return structure, None
+    
+    def _analyze_requirements_batch_with_openai(self, reqs: List[str]) -> List[Dict[str, Any]]:
+        """여러 요구사항을 한 번의 요청으로 분석하여 요구사항 순서대로 다이어그램 구조 목록을 반환합니다."""
+        if not self.azure_openai:
+            logger.warning("OpenAI not configured, using default structure")
+            return [self._get_default_structure() for _ in reqs]
         
-        user_prompt = f"""
-        기존 아키텍처 구조:
-        {json.dumps(previous_structure, ensure_ascii=False, indent=2)}
+        system_prompt = _BATCH_ANALYZE_SYS_PROMPT
+        user_prompt = json_util.dumps({"requirements": reqs}, ensure_ascii=False)
         
-        변경 요구사항:
-        {requirements}
+        try:
+            logger.debug("Calling OpenAI API for batch requirements analysis")
+            content = self._complete(
+                system_prompt,
+                user_prompt,
+                response_format=ARCHITECTURE_BATCH_RESPONSE_FORMAT,
+                model=self._structure_model,
+                **{**STRUCTURE_COMPLETION_OPTIONS, 'max_tokens': STRUCTURE_COMPLETION_OPTIONS['max_tokens'] * len(reqs)}
+            )
+            structures = json_util.loads(content)['results']
+        except Exception as e:
+            logger.exception(f"OpenAI 일괄 분석 오류: {e}")
+            logger.info("Falling back to default structure")
+            return [self._get_default_structure() for _ in reqs]
+        
+        if len(structures) != len(reqs):
+            # 개수가 맞지 않으면 누락분은 기본 구조로 채움
+            logger.warning(f"Batch analysis returned {len(structures)} structures for {len(reqs)} requirements")
+            structures = structures[:len(reqs)]
+            structures += [self._get_default_structure() for _ in range(len(reqs) - len(structures))]
+        return structures
+    
+    def _analyze_modification_with_openai(self, previous_structure: Dict[str, Any], requirements: str) -> Dict[str, Any]:
+        """OpenAI를 사용하여 기존 아키텍처 구조를 분석하고 변경 요구사항에 따라 수정된 구조를 생성합니다."""
         
-        위 기존 아키텍처에 변경 요구사항을 적용하여 수정된 Azure 다이어그램 구조를 JSON으로 생성해주세요.
-        """
+        system_prompt = _MODIFY_SYS_PROMPT
+        user_prompt = f"기존 구조: {json_util.dumps(previous_structure, ensure_ascii=False)}\n변경 요구사항: {requirements}"
         
         logger.debug("Checking OpenAI configuration for modification")
         if not self.azure_openai:
@@ -483,34 +1368,12 @@ class ArchitectureDiagramService:
         
         try:
             logger.debug("Calling OpenAI API for modification analysis")
-            stream_response = self.azure_openai.chat.completions.create(
-                model=azure_openai_deployment_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                stream=True
-            )
-            
-            logger.debug("OpenAI API call completed for modification, processing stream")
-            content = self._process_stream_response(stream_response)
-            logger.debug(f"OpenAI modification response content: {content}")
-            
-            # JSON 추출
-            start_idx = content.find('{')
-            end_idx = content.rfind('}') + 1
-            json_str = content[start_idx:end_idx]
+            content = self._complete(system_prompt, user_prompt, response_format=ARCHITECTURE_RESPONSE_FORMAT, model=self._structure_model, **STRUCTURE_COMPLETION_OPTIONS)
+            logger.debug("OpenAI modification response content: %s", content)
             
-            logger.debug(f"Extracted modification JSON: {json_str}")
+            # response_format으로 스키마가 보장되므로 그대로 파싱
+            return json_util.loads(content)
             
-            result = self._parse_json_safely(json_str, "modification analysis")
-            logger.debug(f"Parsed modification JSON structure: {result}")
-            return result
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse modification JSON even after fixing: {e}")
-            logger.info("Falling back to basic modification")
-            return self._apply_basic_modifications(previous_structure, requirements)
         except Exception as e:
             logger.exception(f"OpenAI 수정 분석 오류: {e}")
             logger.info("Falling back to basic modification")
@@ -520,38 +1383,45 @@ class ArchitectureDiagramService:
         """OpenAI를 사용할 수 없는 경우 기본적인 수정을 적용합니다."""
         logger.info("Applying basic modifications to existing structure")
         
-        # 기존 구조를 복사하여 기본적인 수정 적용
-        modified_structure = json.loads(json.dumps(previous_structure))
+        # 기존 구조를 복사하여 기본적인 수정 적용 (항목은 추가만 하고 기존 dict는 수정하지 않으므로 리스트만 복사해 공유)
+        modified_structure = {
+            **previous_structure,
+            'components': list(previous_structure.get('components', [])),
+            'connections': list(previous_structure.get('connections', [])),
+            'clusters': list(previous_structure.get('clusters', []))
+        }
         
         # 제목에 "Modified" 추가
         original_title = modified_structure.get('title', 'Azure Architecture')
         modified_structure['title'] = f"Modified {original_title}"
         
-        # 요구사항에 따라 간단한 로직으로 구성 요소 추가
+        # 요구사항에 언급된 서비스 키워드에 따라 구성 요소 추가
         # 예: "데이터베이스"가 언급되면 데이터베이스 추가
-        requirements_lower = requirements.lower()
+        matched = _match_modification_keywords(requirements.lower())
         
-        existing_component_ids = {comp['id'] for comp in modified_structure.get('components', [])}
+        existing_component_ids = {comp['id'] for comp in modified_structure['components']}
+        existing_clusters = {cluster['name'] for cluster in modified_structure['clusters']}
         
-        if 'database' in requirements_lower or '데이터베이스' in requirements_lower:
-            if 'database' not in existing_component_ids:
-                new_component = {
-                    "id": "database",
-                    "service": "sql_database",
-                    "label": "SQL Database",
-                    "cluster": "data"
-                }
-                modified_structure.setdefault('components', []).append(new_component)
-                
-                # 데이터 클러스터 추가
-                existing_clusters = {cluster['name'] for cluster in modified_structure.get('clusters', [])}
-                if 'data' not in existing_clusters:
-                    modified_structure.setdefault('clusters', []).append({
-                        "name": "data",
-                        "label": "Data Services"
-                    })
-        
-        logger.debug(f"Basic modifications applied: {modified_structure}")
+        for keyword, (comp_id, service, label, cluster_name, cluster_label) in _BASIC_MODIFICATION_RULES.items():
+            if keyword not in matched or comp_id in existing_component_ids:
+                continue
+            modified_structure['components'].append({
+                "id": comp_id,
+                "service": service,
+                "label": label,
+                "cluster": cluster_name
+            })
+            existing_component_ids.add(comp_id)
+            
+            # 클러스터 추가
+            if cluster_name not in existing_clusters:
+                modified_structure['clusters'].append({
+                    "name": cluster_name,
+                    "label": cluster_label
+                })
+                existing_clusters.add(cluster_name)
+        
+        logger.debug("Basic modifications applied: %s", modified_structure)
         return modified_structure
     
     def _get_default_structure(self) -> Dict[str, Any]:
@@ -579,286 +1449,339 @@ class ArchitectureDiagramService:
             ]
         }
     
+    def _ensure_service_icons(self) -> bool:
+        """diagrams 패키지의 아이콘 경로를 최초 호출 시 한 번만 조회하여 service_icons에 캐시합니다 (미설치 시 아이콘 없이 렌더링)."""
+        global DIAGRAMS_AVAILABLE
+        if DIAGRAMS_AVAILABLE is None:
+            with _DIAGRAMS_LOCK:
+                if DIAGRAMS_AVAILABLE is None:
+                    try:
+                        import diagrams
+                        from diagrams.azure.compute import AppServices, FunctionApps, ContainerInstances, VM, ContainerApps, KubernetesServices
+                        from diagrams.azure.database import DatabaseForPostgresqlServers, CosmosDb, SQLDatabases
+                        from diagrams.azure.storage import StorageAccounts, BlobStorage
+                        from diagrams.azure.network import LoadBalancers, ApplicationGateway, CDNProfiles, VirtualNetworks, Subnets, Firewall, FrontDoors
+                        from diagrams.azure.integration import ServiceBus, LogicApps, APIManagement
+                        from diagrams.azure.analytics import SynapseAnalytics, DataFactories, EventHubs
+                        from diagrams.azure.ml import MachineLearningServiceWorkspaces, CognitiveServices, AzureOpenAI as OpenAI
+                        from diagrams.azure.monitor import Monitor
+                        from diagrams.azure.security import KeyVaults, SecurityCenter, ApplicationSecurityGroups
+                        from diagrams.azure.devops import Devops
+                        from diagrams.onprem.client import Users
+                    except ImportError:
+                        logger.warning("diagrams library not available, rendering diagrams without service icons")
+                        DIAGRAMS_AVAILABLE = False
+                    else:
+                        # 아이콘은 diagrams 패키지 옆의 resources/<_icon_dir>/<_icon>에 설치됨
+                        resources_root = os.path.dirname(os.path.dirname(os.path.abspath(diagrams.__file__)))
+                        node_classes = {
+                            'app_service': AppServices,
+                            'function_app': FunctionApps,
+                            'container_instances': ContainerInstances,
+                            'container_apps': ContainerApps,
+                            'kubernetes_services': KubernetesServices,
+                            'virtual_machines': VM,
+                            'postgresql': DatabaseForPostgresqlServers,
+                            'cosmos_db': CosmosDb,
+                            'sql_database': SQLDatabases,
+                            'storage_account': StorageAccounts,
+                            'blob_storage': BlobStorage,
+                            'load_balancer': LoadBalancers,
+                            'application_gateway': ApplicationGateway,
+                            'cdn': CDNProfiles,
+                            'firewall': Firewall,
+                            'front_door': FrontDoors,
+                            'application_security_group': ApplicationSecurityGroups,
+                            'virtual_network': VirtualNetworks,
+                            'subnet': Subnets,
+                            'api_management': APIManagement,
+                            'service_bus': ServiceBus,
+                            'event_hubs': EventHubs,
+                            'logic_apps': LogicApps,
+                            'synapse': SynapseAnalytics,
+                            'data_factory': DataFactories,
+                            'ml_workspace': MachineLearningServiceWorkspaces,
+                            'cognitive_services': CognitiveServices,
+                            'openai': OpenAI,
+                            'key_vault': KeyVaults,
+                            'security_center': SecurityCenter,
+                            'devops': Devops,
+                            'users': Users,
+                            'monitor': Monitor
+                        }
+                        # DOT 문자열 이스케이프(역슬래시)의 영향을 받지 않도록 경로 구분자는 '/'로 통일
+                        ArchitectureDiagramService.service_icons = types.MappingProxyType({
+                            service: os.path.join(resources_root, node_class._icon_dir, node_class._icon).replace('\\', '/')
+                            for service, node_class in node_classes.items()
+                        })
+                        DIAGRAMS_AVAILABLE = True
+        return DIAGRAMS_AVAILABLE
+    
+    def _prepare_rendering(self):
+        """
+        첫 요청에서 diagrams 임포트, 출력 디렉토리 준비, dot 프로세스 풀 채우기를
+        구조 분석 LLM 호출과 겹치도록 백그라운드에서 시작합니다.
+        """
+        if DIAGRAMS_AVAILABLE is None:
+            DIAGRAM_POOL.submit(self._warm_up_rendering)
+    
+    def _warm_up_rendering(self):
+        try:
+            self._ensure_service_icons()
+            _ensure_diagram_dir()
+            _ensure_dot_format()
+            _schedule_dot_refill()
+        except Exception as e:
+            logger.warning(f"Diagram renderer warm-up failed: {e}")
+    
     def _create_diagram(self, structure: Dict[str, Any]) -> str:
         """다이어그램 구조를 바탕으로 실제 다이어그램을 생성합니다."""
         
         logger.info("Starting diagram creation")
-        logger.debug(f"Structure: {structure}")
+        logger.debug("Structure: %s", structure)
         
-        if not DIAGRAMS_AVAILABLE:
-            logger.error("Error: diagrams library not available")
-            raise ImportError("diagrams 라이브러리가 설치되지 않았습니다. 'pip install diagrams' 명령어로 설치해주세요.")
+        self._ensure_service_icons()
+        _ensure_dot_format()
         
-        # .temp 디렉토리에 다이어그램 생성
-        diagram_id = str(uuid.uuid4())
-        output_dir = os.path.join(os.getcwd(), '.temp')
-        os.makedirs(output_dir, exist_ok=True)
+        # 다이어그램 디렉토리에 생성 (동일 구조는 같은 파일명을 갖도록 구조 해시 사용)
+        diagram_id = hashlib.sha1(json_util.dumpb_sorted(structure)).hexdigest()[:16]
+        output_dir = _ensure_diagram_dir()
         diagram_name = f"azure_architecture_{diagram_id}"
         
-        logger.debug(f"Generated diagram ID: {diagram_id}")
-        logger.debug(f"Output directory: {output_dir}")
-        logger.debug(f"Diagram name: {diagram_name}")
+        logger.debug("Generated diagram ID: %s", diagram_id)
+        logger.debug("Output directory: %s", output_dir)
+        logger.debug("Diagram name: %s", diagram_name)
+        
+        existing_path = os.path.join(output_dir, f"{diagram_name}.{DIAGRAM_FORMAT}")
+        if os.path.exists(existing_path):
+            # 재사용한 파일은 정리 대상에서 밀려나도록 수정 시각 갱신
+            os.utime(existing_path)
+            logger.info(f"Reusing rendered diagram: {DIAGRAM_URL_DIR}/{diagram_name}.{DIAGRAM_FORMAT}")
+            return f"{DIAGRAM_URL_DIR}/{diagram_name}.{DIAGRAM_FORMAT}"
+        
+        base_path = os.path.join(output_dir, diagram_name)
         
         try:
-            with Diagram(
-                structure.get('title', 'Azure Architecture'),
-                filename=os.path.join(output_dir, diagram_name),
-                show=False,
-                direction="TB"
-            ):
-                # 컴포넌트 생성
-                components = {}
-                clusters = {}
-                
-                logger.debug(f"Creating clusters: {structure.get('clusters', [])}")
-                # 클러스터 생성
-                for cluster_info in structure.get('clusters', []):
-                    cluster_name = cluster_info['name']
-                    cluster_label = cluster_info['label']
-                    clusters[cluster_name] = Cluster(cluster_label)
-                    logger.debug(f"Created cluster: {cluster_name} ({cluster_label})")
-                
-                logger.debug(f"Creating components: {structure.get('components', [])}")
-                # 컴포넌트 생성
-                for component in structure.get('components', []):
-                    comp_id = component['id']
-                    service = component['service']
-                    label = component['label']
-                    cluster_name = component.get('cluster')
-                    
-                    logger.debug(f"Processing component: {comp_id} ({service})")
-                    
-                    if service in self.azure_services_map:
-                        service_class = self.azure_services_map[service]
-                        
-                        if cluster_name and cluster_name in clusters:
-                            logger.debug(f"Adding component {comp_id} to cluster {cluster_name}")
-                            with clusters[cluster_name]:
-                                components[comp_id] = service_class(label)
-                        else:
-                            logger.debug(f"Adding component {comp_id} without cluster")
-                            components[comp_id] = service_class(label)
-                    else:
-                        logger.warning(f"Unknown service type: {service}")
-                
-                logger.debug(f"Creating connections: {structure.get('connections', [])}")
-                # 연결 생성
-                for connection in structure.get('connections', []):
-                    from_comp = connection['from']
-                    to_comp = connection['to']
-                    label = connection.get('label', '')
-                    
-                    logger.debug(f"Processing connection: {from_comp} -> {to_comp}")
-                    
-                    if from_comp in components and to_comp in components:
-                        if label:
-                            components[from_comp] >> Edge(label=label) >> components[to_comp]
-                            logger.debug(f"Created labeled connection: {from_comp} -> {to_comp} ({label})")
-                        else:
-                            components[from_comp] >> components[to_comp]
-                            logger.debug(f"Created connection: {from_comp} -> {to_comp}")
-                    else:
-                        logger.warning(f"Invalid connection - missing components: {from_comp} -> {to_comp}")
+            # DOT 소스를 직접 만들어 미리 띄워 둔 dot 프로세스로 렌더링
+            self._render_dot(self._emit_dot(structure), base_path)
             
-            # 생성된 PNG 파일 경로 - 상대 경로로 반환
-            png_path = f".temp/{diagram_name}.png"
-            logger.info(f"Diagram creation completed: {png_path}")
+            # 생성된 이미지 파일 경로 - 상대 경로로 반환
+            diagram_path = f"{DIAGRAM_URL_DIR}/{diagram_name}.{DIAGRAM_FORMAT}"
+            logger.info(f"Diagram creation completed: {diagram_path}")
             
             # 파일이 실제로 생성되었는지 확인
-            full_path = os.path.join(output_dir, f"{diagram_name}.png")
+            full_path = os.path.join(output_dir, f"{diagram_name}.{DIAGRAM_FORMAT}")
             if os.path.exists(full_path):
-                logger.debug(f"Diagram file verified: {full_path}")
+                logger.debug("Diagram file verified: %s", full_path)
             else:
                 logger.warning(f"Diagram file not found: {full_path}")
             
-            return png_path
+            return diagram_path
             
         except Exception as e:
             logger.exception(f"Error during diagram creation: {str(e)}")
             raise
     
+    def _emit_dot(self, structure: Dict[str, Any]) -> str:
+        """다이어그램 구조를 DOT 소스로 변환합니다 (클러스터는 subgraph cluster_N, 컴포넌트는 아이콘 노드)."""
+        icons = self.service_icons
+        debug = logger.isEnabledFor(logging.DEBUG)
+        lines = [
+            'digraph {',
+            f'\tgraph [{_DOT_GRAPH_ATTRS} label={_dot_quote(structure.get("title", "Azure Architecture"))}]',
+            f'\tnode [{_DOT_NODE_ATTRS}]',
+            f'\tedge [{_DOT_EDGE_ATTRS}]'
+        ]
+        
+        # 컴포넌트 노드를 클러스터별로 모음 (알 수 없는 서비스는 건너뜀)
+        node_ids = {}
+        nodes_by_cluster: Dict[Any, List[str]] = {}
+        for i, component in enumerate(structure.get('components', [])):
+            service = component['service']
+            if service not in AZURE_SERVICE_NAMES:
+                logger.warning(f"Unknown service type: {service}")
+                continue
+            node_ids[component['id']] = f'n{i}'
+            label = component['label']
+            icon = icons.get(service)
+            if icon:
+                # 아이콘 아래 라벨이 겹치지 않도록 줄 수만큼 높이를 늘림 (diagrams와 동일)
+                attrs = f'height={_DOT_ICON_HEIGHT + 0.4 * label.count(chr(10)):g} image={_dot_quote(icon)} shape=none'
+            else:
+                attrs = 'labelloc=c'
+            nodes_by_cluster.setdefault(component.get('cluster'), []).append(f'n{i} [label={_dot_quote(label)} {attrs}]')
+            if debug:
+                logger.debug("Adding component %s (%s) to cluster %s", component['id'], service, component.get('cluster'))
+        
+        for j, cluster_info in enumerate(structure.get('clusters', [])):
+            nodes = nodes_by_cluster.pop(cluster_info['name'], None)
+            if not nodes:
+                continue
+            lines.append(f'\tsubgraph cluster_{j} {{')
+            lines.append(f'\t\tgraph [{_DOT_CLUSTER_ATTRS} label={_dot_quote(cluster_info["label"])}]')
+            lines.extend(f'\t\t{node}' for node in nodes)
+            lines.append('\t}')
+        # 클러스터가 없거나 정의되지 않은 클러스터를 가리키는 컴포넌트
+        for nodes in nodes_by_cluster.values():
+            lines.extend(f'\t{node}' for node in nodes)
+        
+        for connection in structure.get('connections', []):
+            from_node = node_ids.get(connection['from'])
+            to_node = node_ids.get(connection['to'])
+            if from_node is None or to_node is None:
+                logger.warning(f"Invalid connection - missing components: {connection['from']} -> {connection['to']}")
+                continue
+            label = connection.get('label')
+            lines.append(f'\t{from_node} -> {to_node} [dir=forward label={_dot_quote(label)}]' if label else f'\t{from_node} -> {to_node} [dir=forward]')
+        
+        lines.append('}')
+        return '\n'.join(lines)
+    
+    def _render_dot(self, dot_source: str, base_path: str):
+        """DOT 소스를 <base_path>.<DIAGRAM_FORMAT> 이미지로 렌더링합니다. 완성된 파일만 보이도록 고유한 임시 파일에 쓴 뒤 교체합니다."""
+        proc = _take_dot_process()
+        try:
+            image, stderr = proc.communicate(dot_source.encode('utf-8'), timeout=DOT_RENDER_TIMEOUT_S)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            raise
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args, image, stderr)
+        
+        _replace_atomically(f"{base_path}.{DIAGRAM_FORMAT}", lambda f: f.write(image))
+    
     def _generate_description(self, structure: Dict[str, Any], requirements: str) -> str:
-        """다이어그램에 대한 상세 설명을 생성합니다."""
+        """다이어그램에 대한 상세 설명을 생성합니다 (스트리밍 결과를 모두 이어 붙인 값)."""
         
-        system_prompt = """
-        당신은 Azure 아키텍처 전문가입니다. 주어진 아키텍처 다이어그램 구조와 원래 요구사항을 바탕으로 
-        상세한 설명을 작성해주세요. 다음 내용을 포함해야 합니다:
-
-        1. 아키텍처 개요
-        2. 주요 구성 요소 설명
-        3. 데이터 흐름 설명
-        4. 보안 고려사항
-        5. 확장성 및 가용성 고려사항
-        6. 비용 최적화 방안
-
-        한국어로 작성해주세요.
-        """
+        try:
+            return ''.join(self._stream_description(structure, requirements))
+            
+        except Exception as e:
+            logger.error(f"설명 생성 오류: {e}")
+            return self._get_default_description(structure)
+    
+    def _stream_description(self, structure: Dict[str, Any], requirements: str) -> Iterator[str]:
+        """다이어그램 설명을 스트리밍으로 생성합니다 (요청은 즉시 시작)."""
+        if not self.azure_openai:
+            return iter((self._get_default_description(structure),))
+        
+        try:
+            return self._complete_stream(*self._description_prompts(structure, requirements), **DESCRIPTION_COMPLETION_OPTIONS)
+        except Exception as e:
+            logger.error(f"설명 생성 오류: {e}")
+            return iter((self._get_default_description(structure),))
+    
+    def _description_prompts(self, structure: Dict[str, Any], requirements: str):
+        """설명 생성용 (system_prompt, user_prompt)"""
+        system_prompt = _DESCRIBE_SYS_PROMPT
         
         user_prompt = f"""
         원래 요구사항: {requirements}
         
         생성된 아키텍처 구조:
-        {json.dumps(structure, ensure_ascii=False, indent=2)}
+        {json_util.dumps_pretty(structure)}
         
         위 정보를 바탕으로 상세한 아키텍처 설명을 작성해주세요.
         """
         
-        if not self.azure_openai:
-            return self._get_default_description(structure)
+        return system_prompt, user_prompt
+    
+    def _generate_modification_description(self, previous_structure: Dict[str, Any], modified_structure: Dict[str, Any], requirements: str) -> str:
+        """수정된 다이어그램에 대한 상세 설명을 생성합니다 (스트리밍 결과를 모두 이어 붙인 값)."""
         
         try:
-            stream_response = self.azure_openai.chat.completions.create(
-                model=azure_openai_deployment_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                stream=True
-            )
-            
-            return self._process_stream_response(stream_response)
+            return ''.join(self._stream_modification_description(previous_structure, modified_structure, requirements))
             
         except Exception as e:
-            print(f"설명 생성 오류: {e}")
-            return self._get_default_description(structure)
+            logger.error(f"수정 설명 생성 오류: {e}")
+            return self._get_default_modification_description(previous_structure, modified_structure, requirements)
     
-    def _generate_modification_description(self, previous_structure: Dict[str, Any], modified_structure: Dict[str, Any], requirements: str) -> str:
-        """수정된 다이어그램에 대한 상세 설명을 생성합니다."""
+    def _stream_modification_description(self, previous_structure: Dict[str, Any], modified_structure: Dict[str, Any], requirements: str) -> Iterator[str]:
+        """수정 설명을 스트리밍으로 생성합니다 (요청은 즉시 시작)."""
+        if not self.azure_openai:
+            return iter((self._get_default_modification_description(previous_structure, modified_structure, requirements),))
         
-        system_prompt = """
-        당신은 Azure 아키텍처 전문가입니다. 기존 아키텍처 구조, 수정된 아키텍처 구조, 그리고 변경 요구사항을 바탕으로 
-        수정 사항에 대한 상세한 설명을 작성해주세요. 다음 내용을 포함해야 합니다:
-
-        1. 수정 개요 (무엇이 변경되었는지)
-        2. 변경된 구성 요소 설명
-        3. 새로 추가된 구성 요소 (있는 경우)
-        4. 제거된 구성 요소 (있는 경우)
-        5. 변경된 데이터 흐름 설명
-        6. 수정으로 인한 이점
-        7. 추가 고려사항
-
-        한국어로 작성해주세요.
-        """
+        try:
+            return self._complete_stream(*self._modification_description_prompts(previous_structure, modified_structure, requirements), **DESCRIPTION_COMPLETION_OPTIONS)
+        except Exception as e:
+            logger.error(f"수정 설명 생성 오류: {e}")
+            return iter((self._get_default_modification_description(previous_structure, modified_structure, requirements),))
+    
+    def _modification_description_prompts(self, previous_structure: Dict[str, Any], modified_structure: Dict[str, Any], requirements: str):
+        """수정 설명 생성용 (system_prompt, user_prompt)"""
+        system_prompt = _MODIFY_DESCRIBE_SYS_PROMPT
         
         user_prompt = f"""
         변경 요구사항: {requirements}
         
         기존 아키텍처 구조:
-        {json.dumps(previous_structure, ensure_ascii=False, indent=2)}
+        {json_util.dumps_pretty(previous_structure)}
         
         수정된 아키텍처 구조:
-        {json.dumps(modified_structure, ensure_ascii=False, indent=2)}
+        {json_util.dumps_pretty(modified_structure)}
         
         위 정보를 바탕으로 아키텍처 수정 사항에 대한 상세한 설명을 작성해주세요.
         """
         
-        if not self.azure_openai:
-            return self._get_default_modification_description(previous_structure, modified_structure, requirements)
-        
-        try:
-            stream_response = self.azure_openai.chat.completions.create(
-                model=azure_openai_deployment_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                stream=True
-            )
-            
-            return self._process_stream_response(stream_response)
-            
-        except Exception as e:
-            print(f"수정 설명 생성 오류: {e}")
-            return self._get_default_modification_description(previous_structure, modified_structure, requirements)
+        return system_prompt, user_prompt
     
     def _get_default_modification_description(self, previous_structure: Dict[str, Any], modified_structure: Dict[str, Any], requirements: str) -> str:
         """기본 수정 설명을 생성합니다."""
         modified_title = modified_structure.get('title', 'Modified Azure Architecture')
         
-        # 변경사항 분석
-        prev_components = {comp['id']: comp for comp in previous_structure.get('components', [])}
-        mod_components = {comp['id']: comp for comp in modified_structure.get('components', [])}
-        
-        added_components = []
-        removed_components = []
+        # 변경사항 분석 (id 집합 차이로 한 번에 계산, 표시 순서는 원래 목록 순서 유지)
+        prev_list = previous_structure.get('components', [])
+        mod_list = modified_structure.get('components', [])
+        prev_ids = {comp['id'] for comp in prev_list}
+        mod_ids = {comp['id'] for comp in mod_list}
+        added_ids = mod_ids - prev_ids
+        removed_ids = prev_ids - mod_ids
         
-        for comp_id in mod_components:
-            if comp_id not in prev_components:
-                added_components.append(mod_components[comp_id]['label'])
-        
-        for comp_id in prev_components:
-            if comp_id not in mod_components:
-                removed_components.append(prev_components[comp_id]['label'])
-        
-        description = f"""# {modified_title}
+        # 문자열은 조각 목록에 모아 마지막에 한 번만 합침
+        parts = [f"""# {modified_title}
 
 ## 수정 개요
 기존 아키텍처에 다음과 같은 변경 요구사항이 적용되었습니다: {requirements}
 
 ## 변경 사항
-"""
+"""]
         
-        if added_components:
-            description += """
+        if added_ids:
+            parts.append("""
 ### 추가된 구성 요소
-"""
-            for component in added_components:
-                description += f"- **{component}**: 새로 추가된 서비스\n"
+""")
+            parts.extend(f"- **{comp['label']}**: 새로 추가된 서비스\n" for comp in _unique_by_id(mod_list, added_ids))
         
-        if removed_components:
-            description += """
+        if removed_ids:
+            parts.append("""
 ### 제거된 구성 요소
-"""
-            for component in removed_components:
-                description += f"- **{component}**: 제거된 서비스\n"
+""")
+            parts.extend(f"- **{comp['label']}**: 제거된 서비스\n" for comp in _unique_by_id(prev_list, removed_ids))
         
-        if not added_components and not removed_components:
-            description += "- 기존 구성 요소의 설정 및 연결이 수정되었습니다.\n"
+        if not added_ids and not removed_ids:
+            parts.append("- 기존 구성 요소의 설정 및 연결이 수정되었습니다.\n")
         
-        description += """
+        parts.append("""
 ## 현재 구성 요소
-"""
-        
-        for component in modified_structure.get('components', []):
-            service = component.get('service', '')
-            label = component.get('label', '')
-            description += f"- **{label}**: {service} 서비스\n"
+""")
+        parts.extend(f"- **{comp.get('label', '')}**: {comp.get('service', '')} 서비스\n" for comp in mod_list)
         
-        description += """
+        parts.append("""
 ## 수정으로 인한 이점
 - 요구사항에 맞는 최적화된 아키텍처 구성
 - 향상된 성능과 확장성
 - 비용 효율적인 리소스 활용
-"""
+""")
         
-        return description
+        return ''.join(parts)
     
     def _get_default_description(self, structure: Dict[str, Any]) -> str:
         """기본 설명을 생성합니다."""
-        title = structure.get('title', 'Azure Architecture')
-        components = structure.get('components', [])
-        
-        description = f"""# {title}
-
-## 아키텍처 개요
-이 아키텍처는 Azure 클라우드 서비스를 활용한 현대적인 웹 애플리케이션 구조입니다.
-
-## 주요 구성 요소
-"""
-        
-        for component in components:
-            service = component.get('service', '')
-            label = component.get('label', '')
-            description += f"- **{label}**: {service} 서비스를 사용한 구성 요소\n"
-        
-        description += """
-## 특징
-- 높은 가용성과 확장성을 제공하는 클라우드 네이티브 아키텍처
-- Azure의 관리형 서비스를 활용한 운영 부담 최소화
-- 보안과 성능을 고려한 네트워크 구성
-"""
-        
-        return description
+        return _render_default_description(
+            structure.get('title', 'Azure Architecture'),
+            tuple((component.get('label', ''), component.get('service', '')) for component in structure.get('components', []))
+        )
     
     def _format_description_with_diagram(self, description: str, diagram_path: str) -> str:
         """설명과 다이어그램을 포함한 포맷된 응답을 생성합니다."""
@@ -909,7 +1832,7 @@ class ArchitectureDiagramService:
             
             try:
                 structure = self._parse_json_safely(structure_json, "bicep generation")
-                logger.debug(f"Parsed structure: {structure}")
+                logger.debug("Parsed structure: %s", structure)
                 
                 # Validate structure format
                 if not isinstance(structure, dict):
@@ -984,25 +1907,13 @@ class ArchitectureDiagramService:
         bicep_prompt = self._create_bicep_generation_prompt(structure)
         
         try:
-            stream_response = self.azure_openai.chat.completions.create(
-                model=azure_openai_deployment_name,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "당신은 Azure Bicep 인프라 코드 생성 전문가입니다. 주어진 아키텍처 구조를 분석하여 완전하고 배포 가능한 Bicep 코드를 생성해주세요. Azure 모범 사례를 따르고, 보안, 가용성, 확장성을 고려한 코드를 작성해주세요."
-                    },
-                    {
-                        "role": "user", 
-                        "content": bicep_prompt
-                    }
-                ],
+            bicep_content = self._complete(
+                _BICEP_SYS_PROMPT,
+                bicep_prompt,
                 max_tokens=4000,
-                temperature=0.1,
-                stream=True
+                temperature=0.1
             )
-            
-            bicep_content = self._process_stream_response(stream_response)
-            logger.debug(f"Generated Bicep content: {bicep_content}")
+            logger.debug("Generated Bicep content: %s", bicep_content)
             
             # Bicep 코드와 파라미터 파일 분리
             return self._parse_bicep_response(bicep_content)
@@ -1021,8 +1932,8 @@ class ArchitectureDiagramService:
         title = structure.get('title', 'Azure Infrastructure')
         
         # Log structure for debugging
-        logger.debug(f"Components type: {type(components)}, value: {components}")
-        logger.debug(f"Connections type: {type(connections)}, value: {connections}")
+        logger.debug("Components type: %s, value: %s", type(components), components)
+        logger.debug("Connections type: %s, value: %s", type(connections), connections)
         
         # Ensure components is a list
         if not isinstance(components, list):
@@ -1074,37 +1985,7 @@ class ArchitectureDiagramService:
                 if source and target:
                     prompt += f"- {source} → {target}\n"
         
-        prompt += f"""
-
-## 요구사항:
-1. **Bicep 모범 사례 준수**:
-   - 리소스 명명 규칙 적용 (prefix, suffix, 환경별 구분)
-   - 매개변수와 변수 적절히 사용
-   - 태그를 활용한 리소스 관리
-   - User-Defined Types 활용
-   - @secure() 데코레이터 사용
-
-2. **보안 고려사항**:
-   - Managed Identity 사용
-   - Key Vault 통합
-   - 네트워크 보안 그룹 설정
-   - HTTPS/TLS 강제
-
-3. **운영 고려사항**:
-   - 모니터링 및 로깅 설정
-   - 백업 및 재해 복구
-   - 자동 스케일링 구성
-   - 비용 최적화
-
-4. **출력 형식**:
-   - main.bicep: 메인 인프라 코드
-   - main.bicepparam: 매개변수 파일
-   - 각 파일을 명확하게 구분하여 출력
-
-다음 서비스 매핑을 참고하세요:
-{self.AZURE_SERVICES_DESCRIPTION}
-
-완전하고 배포 가능한 Bicep 코드를 생성해주세요. 각 파일은 ```bicep 또는 ```bicepparam 코드 블록으로 구분하여 출력해주세요."""
+        prompt += "\n완전하고 배포 가능한 Bicep 코드를 생성해주세요."
         
         return prompt
 
@@ -1112,24 +1993,20 @@ class ArchitectureDiagramService:
         """
         OpenAI 응답에서 Bicep 코드와 파라미터 파일을 분리합니다.
         """
-        import re
-        
         result = {
             'bicep_code': '',
             'parameters_file': ''
         }
         
         # Bicep 메인 파일 추출
-        bicep_pattern = r'```bicep\n(.*?)\n```'
-        bicep_matches = re.findall(bicep_pattern, bicep_content, re.DOTALL)
-        if bicep_matches:
-            result['bicep_code'] = bicep_matches[0].strip()
+        bicep_match = _BICEP_BLOCK.search(bicep_content)
+        if bicep_match:
+            result['bicep_code'] = bicep_match.group(1).strip()
         
         # 파라미터 파일 추출
-        param_pattern = r'```bicepparam\n(.*?)\n```'
-        param_matches = re.findall(param_pattern, bicep_content, re.DOTALL)
-        if param_matches:
-            result['parameters_file'] = param_matches[0].strip()
+        param_match = _BICEP_PARAM_BLOCK.search(bicep_content)
+        if param_match:
+            result['parameters_file'] = param_match.group(1).strip()
         
         # 코드 블록이 없는 경우 전체 응답을 bicep_code로 사용
         if not result['bicep_code'] and not result['parameters_file']:
@@ -1,21 +1,77 @@
 import azure.cognitiveservices.speech as speechsdk
 import datetime
-import html
-import json
 import logging
 import pytz
+import re
 import requests
+import string
 import threading
 import time
-import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from util import json_util
+from util.green import run_blocking
 
 # 로거 설정
 logger = logging.getLogger(__name__)
+
+# 발화 워커 스레드 풀 (발화 묶음마다 스레드를 새로 만들지 않도록 재사용)
+SPEAK_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix='speak')
+
+# 토큰 갱신용 HTTP 세션 (keep-alive로 갱신마다 TLS 핸드셰이크 생략)
+STS_SESSION = requests.Session()
+STS_SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=4))
+STS_TIMEOUT = (3.05, 10)  # (connect, read) 초
+
+# SSML 템플릿 (발화마다 재사용)
+SSML_TPL = """<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xmlns:mstts='http://www.w3.org/2001/mstts' xml:lang='en-US'>
+                 <voice name='{voice}'>
+                     <mstts:ttsembedding speakerProfileId='{spid}'>
+                         <mstts:leadingsilence-exact value='0'/>
+                         {text}
+                     </mstts:ttsembedding>
+                 </voice>
+               </speak>"""
+
+SSML_TPL_BREAK = """<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xmlns:mstts='http://www.w3.org/2001/mstts' xml:lang='en-US'>
+                       <voice name='{voice}'>
+                           <mstts:ttsembedding speakerProfileId='{spid}'>
+                               <mstts:leadingsilence-exact value='0'/>
+                               {text}
+                               <break time='{break_ms}ms' />
+                           </mstts:ttsembedding>
+                       </voice>
+                     </speak>"""
+
+# SSML 텍스트 이스케이프 (html.escape와 동일한 치환, 특수문자가 없으면 원문 그대로 사용)
+_ESCAPE_TABLE = str.maketrans({
+    '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#x27;'
+})
+_ESCAPE_SCAN = re.compile(r'[&<>"\']').search
+
+
+def _escape_text(text: str) -> str:
+    return text.translate(_ESCAPE_TABLE) if _ESCAPE_SCAN(text) else text
+
+
+# 아바타 연결 설정 템플릿 (고정 필드는 미리 직렬화, 가변 필드는 JSON 인코딩된 값으로 치환)
+AVATAR_CONFIG_TPL = string.Template(
+    '{"synthesis":{"video":{'
+    '"protocol":{"name":"WebRTC","webrtcConfig":{"clientDescription":$client_description,'
+    '"iceServers":[{"urls":$ice_urls,"username":$username,"credential":$credential}]}},'
+    '"format":{"crop":{"topLeft":{"x":$crop_left,"y":0},"bottomRight":{"x":$crop_right,"y":1080}},'
+    '"bitrate":1000000},'
+    '"talkingAvatar":{"customized":$customized,"character":$character,"style":$style,'
+    '"background":{"color":$bg_color,"image":{"url":$bg_url}}}}}}'
+)
+
+
 class AvatarService:
     def __init__(self, speech_region: str, speech_key: str, ice_server_url: str = None, 
                  ice_server_url_remote: str = None, ice_server_username: str = None, 
                  ice_server_password: str = None, enable_token_auth: bool = False,
-                 default_tts_voice: str = 'en-US-JennyMultilingualV2Neural'):
+                 default_tts_voice: str = 'en-US-JennyMultilingualV2Neural', client_manager=None):
         self.speech_region = speech_region
         self.speech_key = speech_key
         self.ice_server_url = ice_server_url
@@ -24,10 +80,21 @@ class AvatarService:
         self.ice_server_password = ice_server_password
         self.enable_token_auth = enable_token_auth
         self.default_tts_voice = default_tts_voice
+        self.client_manager = client_manager
         
         self.speech_token = None
+        self.speech_token_ready = threading.Event()
         self.ice_token = None
         
+        # 커스텀 ICE 서버 설정은 프로세스 내에서 변하지 않으므로 한 번만 직렬화
+        self.custom_ice_token = None
+        if self.ice_server_url and self.ice_server_username and self.ice_server_password:
+            self.custom_ice_token = json_util.dumpb({
+                'Urls': [self.ice_server_url],
+                'Username': self.ice_server_username,
+                'Password': self.ice_server_password
+            })
+        
         self._start_token_refresh_threads()
     
     def _start_token_refresh_threads(self):
@@ -42,10 +109,12 @@ class AvatarService:
     def _refresh_speech_token(self):
         while True:
             try:
-                self.speech_token = requests.post(
+                self.speech_token = STS_SESSION.post(
                     f'https://{self.speech_region}.api.cognitive.microsoft.com/sts/v1.0/issueToken',
-                    headers={'Ocp-Apim-Subscription-Key': self.speech_key}
+                    headers={'Ocp-Apim-Subscription-Key': self.speech_key},
+                    timeout=STS_TIMEOUT
                 ).text
+                self.speech_token_ready.set()
             except Exception as e:
                 logger.error(f"Failed to refresh speech token: {e}")
             time.sleep(60 * 9)  # 9분마다 갱신
@@ -54,16 +123,17 @@ class AvatarService:
         while True:
             try:
                 if self.enable_token_auth:
-                    while not self.speech_token:
-                        time.sleep(0.2)
-                    ice_token_response = requests.get(
+                    self.speech_token_ready.wait()
+                    ice_token_response = STS_SESSION.get(
                         f'https://{self.speech_region}.tts.speech.microsoft.com/cognitiveservices/avatar/relay/token/v1',
-                        headers={'Authorization': f'Bearer {self.speech_token}'}
+                        headers={'Authorization': f'Bearer {self.speech_token}'},
+                        timeout=STS_TIMEOUT
                     )
                 else:
-                    ice_token_response = requests.get(
+                    ice_token_response = STS_SESSION.get(
                         f'https://{self.speech_region}.tts.speech.microsoft.com/cognitiveservices/avatar/relay/token/v1',
-                        headers={'Ocp-Apim-Subscription-Key': self.speech_key}
+                        headers={'Ocp-Apim-Subscription-Key': self.speech_key},
+                        timeout=STS_TIMEOUT
                     )
                 
                 if ice_token_response.status_code == 200:
@@ -79,13 +149,8 @@ class AvatarService:
     
     def get_ice_token(self) -> str:
         """ICE 토큰 반환"""
-        if self.ice_server_url and self.ice_server_username and self.ice_server_password:
-            custom_ice_token = json.dumps({
-                'Urls': [self.ice_server_url],
-                'Username': self.ice_server_username,
-                'Password': self.ice_server_password
-            })
-            return custom_ice_token
+        if self.custom_ice_token:
+            return self.custom_ice_token
         return self.ice_token
     
     def connect_avatar(self, client_context: dict, local_sdp: str, avatar_character: str,
@@ -96,8 +161,7 @@ class AvatarService:
                       personal_voice_speaker_profile_id: str = None) -> str:
         try:
             if self.enable_token_auth:
-                while not self.speech_token:
-                    time.sleep(0.2)
+                self.speech_token_ready.wait()
                 speech_config = speechsdk.SpeechConfig(
                     endpoint=f'wss://{self.speech_region}.tts.speech.microsoft.com/cognitiveservices/websocket/v1?enableTalkingAvatar=true'
                 )
@@ -114,7 +178,15 @@ class AvatarService:
             speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
             client_context['speech_synthesizer'] = speech_synthesizer
             
-            ice_token_obj = json.loads(self.ice_token) if self.ice_token else {}
+            # 합성 종료 신호 (disconnect 시 고정 sleep 대신 대기)
+            synthesis_stopped = threading.Event()
+            synthesis_stopped.set()
+            client_context['synthesis_stopped'] = synthesis_stopped
+            speech_synthesizer.synthesis_started.connect(lambda evt: synthesis_stopped.clear())
+            speech_synthesizer.synthesis_completed.connect(lambda evt: synthesis_stopped.set())
+            speech_synthesizer.synthesis_canceled.connect(lambda evt: synthesis_stopped.set())
+            
+            ice_token_obj = json_util.loads(self.ice_token) if self.ice_token else {}
             if self.ice_server_url and self.ice_server_username and self.ice_server_password:
                 ice_token_obj = {
                     'Urls': [self.ice_server_url_remote] if self.ice_server_url_remote else [self.ice_server_url],
@@ -137,7 +209,7 @@ class AvatarService:
                 client_context['speech_synthesizer_connected'] = False
             
             connection.disconnected.connect(tts_disconnected_cb)
-            connection.set_message_property('speech.config', 'context', json.dumps(avatar_config))
+            connection.set_message_property('speech.config', 'context', avatar_config)
             
             client_context['speech_synthesizer_connection'] = connection
             client_context['speech_synthesizer_connected'] = True
@@ -145,8 +217,9 @@ class AvatarService:
             client_context['custom_voice_endpoint_id'] = custom_voice_endpoint_id
             client_context['personal_voice_speaker_profile_id'] = personal_voice_speaker_profile_id
             
-            speech_synthesis_result = speech_synthesizer.speak_text_async('').get()
-            logger.debug(f'Result id for avatar connection: {speech_synthesis_result.result_id}')
+            # 전체 합성 완료를 기다리지 않고 turn.start 메시지(WebRTC SDP)만 수신되면 반환
+            speech_synthesis_result = speech_synthesizer.start_speaking_text_async('').get()
+            logger.debug('Result id for avatar connection: %s', speech_synthesis_result.result_id)
             
             if speech_synthesis_result.reason == speechsdk.ResultReason.Canceled:
                 cancellation_details = speech_synthesis_result.cancellation_details
@@ -154,82 +227,85 @@ class AvatarService:
                 if cancellation_details.reason == speechsdk.CancellationReason.Error:
                     logger.error(f"Error details: {cancellation_details.error_details}")
                     raise Exception(cancellation_details.error_details)
+                # 취소된 합성에서는 turn.start가 오지 않으므로 폴링하지 않음
+                raise Exception(f"Speech synthesis canceled: {cancellation_details.reason}")
             
-            turn_start_message = speech_synthesizer.properties.get_property_by_name('SpeechSDKInternal-ExtraTurnStartMessage')
-            remote_sdp = json.loads(turn_start_message)['webrtc']['connectionString']
+            turn_start_message = self._wait_for_turn_start_message(speech_synthesizer)
+            remote_sdp = json_util.loads(turn_start_message)['webrtc']['connectionString']
             
             return remote_sdp
             
         except Exception as e:
             raise Exception(f"Avatar connection failed: {e}")
     
+    def _wait_for_turn_start_message(self, speech_synthesizer, timeout_s: float = 5.0) -> str:
+        """turn.start 메시지가 synthesizer 속성에 채워질 때까지 짧게 대기합니다 (시간 초과 시 TimeoutError)."""
+        deadline = time.monotonic() + timeout_s
+        while True:
+            turn_start_message = speech_synthesizer.properties.get_property_by_name('SpeechSDKInternal-ExtraTurnStartMessage')
+            if turn_start_message:
+                return turn_start_message
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f'turn.start message not received within {timeout_s:g}s')
+            time.sleep(0.01)
+    
     def _create_avatar_config(self, local_sdp: str, ice_token_obj: dict, avatar_character: str,
                              avatar_style: str, background_color: str, background_image_url: str,
-                             is_custom_avatar: bool, transparent_background: bool, video_crop: bool) -> dict:
-        return {
-            'synthesis': {
-                'video': {
-                    'protocol': {
-                        'name': "WebRTC",
-                        'webrtcConfig': {
-                            'clientDescription': local_sdp,
-                            'iceServers': [{
-                                'urls': [ice_token_obj['Urls'][0]] if ice_token_obj.get('Urls') else [],
-                                'username': ice_token_obj.get('Username', ''),
-                                'credential': ice_token_obj.get('Password', '')
-                            }]
-                        },
-                    },
-                    'format': {
-                        'crop': {
-                            'topLeft': {
-                                'x': 600 if video_crop else 0,
-                                'y': 0
-                            },
-                            'bottomRight': {
-                                'x': 1320 if video_crop else 1920,
-                                'y': 1080
-                            }
-                        },
-                        'bitrate': 1000000
-                    },
-                    'talkingAvatar': {
-                        'customized': is_custom_avatar,
-                        'character': avatar_character,
-                        'style': avatar_style,
-                        'background': {
-                            'color': '#00FF00FF' if transparent_background else background_color,
-                            'image': {
-                                'url': background_image_url
-                            }
-                        }
-                    }
-                }
-            }
-        }
+                             is_custom_avatar: bool, transparent_background: bool, video_crop: bool) -> str:
+        """아바타 연결 설정 JSON 문자열 생성 (가변 필드만 직렬화하여 템플릿에 치환)"""
+        dumps = json_util.dumps
+        return AVATAR_CONFIG_TPL.substitute(
+            client_description=dumps(local_sdp),
+            ice_urls=dumps([ice_token_obj['Urls'][0]] if ice_token_obj.get('Urls') else []),
+            username=dumps(ice_token_obj.get('Username', '')),
+            credential=dumps(ice_token_obj.get('Password', '')),
+            crop_left=600 if video_crop else 0,
+            crop_right=1320 if video_crop else 1920,
+            customized=dumps(is_custom_avatar),
+            character=dumps(avatar_character),
+            style=dumps(avatar_style),
+            bg_color=dumps('#00FF00FF' if transparent_background else background_color),
+            bg_url=dumps(background_image_url)
+        )
     
     def disconnect_avatar(self, client_context: dict, is_reconnecting: bool = False):
         self.stop_speaking(client_context, is_reconnecting)
-        time.sleep(2)
+        synthesis_stopped = client_context.get('synthesis_stopped')
+        if synthesis_stopped:
+            synthesis_stopped.wait(timeout=2.0)
         avatar_connection = client_context.get('speech_synthesizer_connection')
         if avatar_connection:
             avatar_connection.close()
     
-    def speak_with_queue(self, text: str, ending_silence_ms: int, client_context: dict, client_id: uuid.UUID):
-        spoken_text_queue = client_context.get('spoken_text_queue', [])
-        is_speaking = client_context.get('is_speaking', False)
+    def speak_with_queue_by_client(self, text: str, ending_silence_ms: int, client_id: str):
+        """client_id로 컨텍스트를 조회하여 발화 큐에 추가 (ChatService speak_callback 용)"""
+        client_context = self.client_manager.get_client_context(client_id)
+        self.speak_with_queue(text, ending_silence_ms, client_context, client_id)
+    
+    def speak_with_queue(self, text: str, ending_silence_ms: int, client_context: dict, client_id: str):
+        spoken_text_queue = client_context.get('spoken_text_queue', deque())
+        speaking_lock = client_context.setdefault('speaking_lock', threading.Lock())
         
-        if text:
-            spoken_text_queue.append(text)
+        # 큐 추가와 발화 루프 시작 여부 판단을 잠금 안에서 처리 (풀 작업이 시작되기 전에도 클라이언트당 루프는 하나만 제출)
+        with speaking_lock:
+            if text:
+                spoken_text_queue.append(text)
+            if client_context.get('is_speaking', False):
+                return
+            client_context['is_speaking'] = True
         
-        if not is_speaking:
-            def speak_thread():
-                tts_voice = client_context.get('tts_voice', self.default_tts_voice)
-                personal_voice_speaker_profile_id = client_context.get('personal_voice_speaker_profile_id')
-                client_context['is_speaking'] = True
-                
-                while len(spoken_text_queue) > 0:
-                    text_to_speak = spoken_text_queue.pop(0)
+        def speak_thread():
+            tts_voice = client_context.get('tts_voice', self.default_tts_voice)
+            personal_voice_speaker_profile_id = client_context.get('personal_voice_speaker_profile_id')
+            
+            try:
+                while True:
+                    with speaking_lock:
+                        if not spoken_text_queue:
+                            # 비었는지 확인과 플래그 해제를 같은 잠금 안에서 처리해 그 사이에 추가된 텍스트가 남지 않도록 함
+                            client_context['is_speaking'] = False
+                            break
+                        text_to_speak = spoken_text_queue.popleft()
                     client_context['speaking_text'] = text_to_speak
                     try:
                         self.speak_text(text_to_speak, tts_voice, personal_voice_speaker_profile_id, 
@@ -238,13 +314,14 @@ class AvatarService:
                         logger.error(f"Error in speaking text: {e}")
                         break
                     client_context['last_speak_time'] = datetime.datetime.now(pytz.UTC)
-                
-                client_context['is_speaking'] = False
+            finally:
+                # 오류로 중단된 경우에도 다음 발화 요청이 루프를 다시 시작할 수 있도록 해제
+                with speaking_lock:
+                    client_context['is_speaking'] = False
                 client_context['speaking_text'] = None
                 logger.debug("Speaking thread stopped.")
-            
-            client_context['speaking_thread'] = threading.Thread(target=speak_thread)
-            client_context['speaking_thread'].start()
+        
+        client_context['speaking_thread'] = SPEAK_POOL.submit(speak_thread)
     
     def speak_text(self, text: str, voice: str, speaker_profile_id: str, 
                    ending_silence_ms: int, client_context: dict) -> str:
@@ -252,26 +329,13 @@ class AvatarService:
         return self.speak_ssml(ssml, client_context, False)
     
     def _create_ssml(self, text: str, voice: str, speaker_profile_id: str, ending_silence_ms: int) -> str:
-        base_ssml = f"""<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xmlns:mstts='http://www.w3.org/2001/mstts' xml:lang='en-US'>
-                         <voice name='{voice}'>
-                             <mstts:ttsembedding speakerProfileId='{speaker_profile_id}'>
-                                 <mstts:leadingsilence-exact value='0'/>
-                                 {html.escape(text)}
-                             </mstts:ttsembedding>
-                         </voice>
-                       </speak>"""
-        
-        if ending_silence_ms > 0:
-            base_ssml = f"""<speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis' xmlns:mstts='http://www.w3.org/2001/mstts' xml:lang='en-US'>
-                             <voice name='{voice}'>
-                                 <mstts:ttsembedding speakerProfileId='{speaker_profile_id}'>
-                                     <mstts:leadingsilence-exact value='0'/>
-                                     {html.escape(text)}
-                                     <break time='{ending_silence_ms}ms' />
-                                 </mstts:ttsembedding>
-                             </voice>
-                           </speak>"""
-        return base_ssml
+        template = SSML_TPL_BREAK if ending_silence_ms > 0 else SSML_TPL
+        return template.format_map({
+            'voice': voice,
+            'spid': speaker_profile_id,
+            'text': _escape_text(text),
+            'break_ms': ending_silence_ms
+        })
     
     def speak_ssml(self, ssml: str, client_context: dict, asynchronized: bool) -> str:
         speech_synthesizer = client_context.get('speech_synthesizer')
@@ -279,8 +343,8 @@ class AvatarService:
             raise Exception("Speech synthesizer not initialized")
         
         speech_synthesis_result = (
-            speech_synthesizer.start_speaking_ssml_async(ssml).get() if asynchronized
-            else speech_synthesizer.speak_ssml_async(ssml).get()
+            run_blocking(speech_synthesizer.start_speaking_ssml_async(ssml).get) if asynchronized
+            else run_blocking(speech_synthesizer.speak_ssml_async(ssml).get)
         )
         
         if speech_synthesis_result.reason == speechsdk.ResultReason.Canceled:
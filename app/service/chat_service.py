@@ -3,10 +3,9 @@ import logging
 import os
 import random
 import re
-import uuid
 from openai import AzureOpenAI
 from typing import Generator, Dict
-from .architecture_diagram_service import ArchitectureDiagramService
+from util import json_util
 
 azure_openai_endpoint = os.environ.get('AZURE_OPENAI_ENDPOINT')
 azure_openai_api_key = os.environ.get('AZURE_OPENAI_API_KEY')
@@ -33,9 +32,10 @@ if azure_openai_endpoint and azure_openai_api_key:
 
 class ChatService:
     
-    def __init__(self):
+    def __init__(self, architecture_service):
         self.client_contexts = {}
-        self.architecture_service = ArchitectureDiagramService()
+        # 앱 전체에서 하나만 만드는 ArchitectureDiagramService (캐시/배처/keep-alive 공유)
+        self.architecture_service = architecture_service
     
     def set_client_contexts(self, client_contexts: Dict):
         self.client_contexts = client_contexts
@@ -78,8 +78,10 @@ class ChatService:
 반드시 유효한 JSON 형태로만 응답해주세요.
 """
     
-    def initialize_chat_context(self, system_prompt: str, client_id: uuid.UUID) -> None:
-        client_context = self.client_contexts[client_id]
+    def initialize_chat_context(self, system_prompt: str, client_id: str) -> None:
+        client_context = self.client_contexts.get(client_id)
+        if client_context is None:
+            return
         messages = client_context['messages']
         data_sources = client_context['data_sources']
 
@@ -117,9 +119,12 @@ class ChatService:
             }
             messages.append(system_message)
 
-    def handle_user_query(self, user_query: str, client_id: uuid.UUID, 
+    def handle_user_query(self, user_query: str, client_id: str, 
                          speak_callback=None) -> Generator[str, None, None]:
-        client_context = self.client_contexts[client_id]
+        client_context = self.client_contexts.get(client_id)
+        if client_context is None:
+            # 이미 해제된 클라이언트 (비동기 STT 콜백 등)
+            return
         messages = client_context['messages']
         data_sources = client_context['data_sources']
 
@@ -143,7 +148,7 @@ class ChatService:
 사용자가 아키텍처 수정이나 Bicep 코드 생성을 요청하면 위 구조를 활용해주세요."""
             
             chat_message['content'] += architecture_context
-            logger.info(f"Added current structure context for client {client_id}")
+            logger.info("Added current structure context for client %s", client_id)
         
         # LLM에서 JSON 응답 받기
         response = azure_openai.chat.completions.create(
@@ -153,15 +158,15 @@ class ChatService:
         )
         
         response_content = response.choices[0].message.content
-        logger.info(f"LLM Response: {response_content}")
+        logger.info("LLM Response: %s", response_content)
         
         try:
             # JSON 응답 파싱
-            llm_response = json.loads(response_content)
+            llm_response = json_util.loads(response_content)
             response_text = llm_response.get("response", "")
             action = llm_response.get("action", "")
             
-            logger.info(f"Parsed response - action: {action}, response length: {len(response_text)}")
+            logger.info("Parsed response - action: %s, response length: %d", action, len(response_text))
             
             # 응답 메시지를 스트리밍으로 출력
             yield response_text + "\n\n"
@@ -179,8 +184,8 @@ class ChatService:
                 if speak_callback:
                     speak_callback("아키텍처 다이어그램을 생성하고 있습니다.", 0, client_id)
                 
-                result = self.architecture_service.generate_architecture_diagram(user_query)
-                yield from self._handle_architecture_result(result, "generate", client_id, speak_callback)
+                events = self.architecture_service.stream_architecture_diagram(user_query)
+                yield from self._handle_architecture_stream(events, "generate", client_id, speak_callback)
                 
             elif action == "modify_architecture_diagram":
                 logger.info("Executing modify_architecture_diagram")
@@ -192,8 +197,8 @@ class ChatService:
                     speak_callback("아키텍처 다이어그램을 수정하고 있습니다.", 0, client_id)
                 
                 if current_structure:
-                    result = self.architecture_service.modify_architecture_diagram(current_structure, user_query)
-                    yield from self._handle_architecture_result(result, "modify", client_id, speak_callback)
+                    events = self.architecture_service.stream_modified_architecture_diagram(current_structure, user_query)
+                    yield from self._handle_architecture_stream(events, "modify", client_id, speak_callback)
                 else:
                     error_msg = "수정할 기존 아키텍처가 없습니다. 먼저 아키텍처를 생성해주세요."
                     yield error_msg
@@ -229,7 +234,7 @@ class ChatService:
             
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse LLM response as JSON: {e}")
-            logger.debug(f"Response content: {response_content}")
+            logger.debug("Response content: %s", response_content)
             
             # JSON 파싱 실패 시 일반적인 스트리밍 응답으로 폴백
             yield "죄송합니다. 응답을 처리하는 중 오류가 발생했습니다. 다시 시도해주세요.\n\n"
@@ -237,60 +242,70 @@ class ChatService:
             if speak_callback:
                 speak_callback("응답을 처리하는 중 오류가 발생했습니다.", 0, client_id)
     
-    def _handle_architecture_result(self, result: dict, operation_type: str, client_id: uuid.UUID, speak_callback=None) -> Generator[str, None, None]:
-        """아키텍처 생성/수정 결과 처리"""
-        client_context = self.client_contexts[client_id]
+    def _handle_architecture_stream(self, events, operation_type: str, client_id: str, speak_callback=None) -> Generator[str, None, None]:
+        """아키텍처 생성/수정 스트림 처리 (첫 항목은 결과 dict, 이후는 설명 텍스트 조각)"""
+        client_context = self.client_contexts.get(client_id)
+        if client_context is None:
+            return
         
-        if result.get('success'):
-            diagram_path = result['diagram_path']
-            description = result['description']
-            structure = result['structure']
-            
-            logger.info(f"Architecture {operation_type} successful: {diagram_path}")
-            
-            # 클라이언트 컨텍스트에 현재 구조 저장
-            client_context['current_structure'] = structure
-            logger.info(f"Updated current_structure for client {client_id}")
-            
-            # 완료 메시지
-            if operation_type == "generate":
-                yield "✅ 다이어그램 생성이 완료되었습니다!\n\n"
-                if speak_callback:
-                    speak_callback("다이어그램 생성이 완료되었습니다.", 0, client_id)
-            elif operation_type == "modify":
-                yield "✅ 다이어그램 수정이 완료되었습니다!\n\n"
-                if speak_callback:
-                    speak_callback("다이어그램 수정이 완료되었습니다.", 0, client_id)
-            
-            # 다이어그램 경로와 구조를 클라이언트에게 전송
-            yield f"<DIAGRAM>{diagram_path}</DIAGRAM>"
-            yield f"<STRUCTURE>{structure}</STRUCTURE>"
+        try:
+            result = next(events)
+        except Exception as e:
+            # 오류 발생 시
+            error_message = f"다이어그램 {operation_type} 중 오류가 발생했습니다: {e}"
+            logger.exception("Architecture %s error: %s", operation_type, e)
+            yield error_message
             
-            # 설명을 스트리밍으로 전송
-            if description:
-                spoken_sentence = ''
-                for char in description:
-                    yield char
-                    if speak_callback and char in sentence_level_punctuations:
+            if speak_callback:
+                speak_callback("다이어그램 작업 중 오류가 발생했습니다.", 0, client_id)
+            return
+        
+        diagram_path = result['diagram_path']
+        structure = result['structure']
+        
+        logger.info("Architecture %s successful: %s", operation_type, diagram_path)
+        
+        # 클라이언트 컨텍스트에 현재 구조 저장
+        client_context['current_structure'] = structure
+        logger.info("Updated current_structure for client %s", client_id)
+        
+        # 완료 메시지
+        if operation_type == "generate":
+            yield "✅ 다이어그램 생성이 완료되었습니다!\n\n"
+            if speak_callback:
+                speak_callback("다이어그램 생성이 완료되었습니다.", 0, client_id)
+        elif operation_type == "modify":
+            yield "✅ 다이어그램 수정이 완료되었습니다!\n\n"
+            if speak_callback:
+                speak_callback("다이어그램 수정이 완료되었습니다.", 0, client_id)
+        
+        # 다이어그램 경로와 구조를 클라이언트에게 전송
+        yield f"<DIAGRAM>{diagram_path}</DIAGRAM>"
+        yield f"<STRUCTURE>{structure}</STRUCTURE>"
+        yield f"{result['diagram_tag']}\n\n"
+        
+        # 설명은 생성되는 대로 전송하고, 문장 단위로 음성 합성
+        spoken_sentence = ''
+        try:
+            for chunk in events:
+                yield chunk
+                if not speak_callback:
+                    continue
+                for char in chunk:
+                    if char in sentence_level_punctuations:
                         if spoken_sentence.strip():
                             speak_callback(spoken_sentence.strip(), 0, client_id)
                             spoken_sentence = ''
                     else:
                         spoken_sentence += char
-                
-                # 마지막 문장 처리
-                if spoken_sentence.strip() and speak_callback:
-                    speak_callback(spoken_sentence.strip(), 0, client_id)
-        else:
-            # 오류 발생 시
-            error_message = f"다이어그램 {operation_type} 중 오류가 발생했습니다: {result.get('error', 'Unknown error')}"
-            logger.error(f"Architecture {operation_type} error: {result.get('error', 'Unknown error')}")
-            yield error_message
-            
-            if speak_callback:
-                speak_callback("다이어그램 작업 중 오류가 발생했습니다.", 0, client_id)
+        except Exception as e:
+            logger.error("Description stream error: %s", e)
+        
+        # 마지막 문장 처리
+        if spoken_sentence.strip() and speak_callback:
+            speak_callback(spoken_sentence.strip(), 0, client_id)
     
-    def _handle_bicep_result(self, result: dict, client_id: uuid.UUID, speak_callback=None) -> Generator[str, None, None]:
+    def _handle_bicep_result(self, result: dict, client_id: str, speak_callback=None) -> Generator[str, None, None]:
         """Bicep 코드 생성 결과 처리"""
         if result.get('success'):
             bicep_code = result.get('bicep_code', '')
@@ -331,6 +346,3 @@ class ChatService:
             
             if speak_callback:
                 speak_callback("비셉 코드 생성 중 오류가 발생했습니다.", 0, client_id)
-
-
-chat_service = ChatService()
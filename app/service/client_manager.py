@@ -1,24 +1,58 @@
 import uuid
 import logging
-from typing import Dict, Any
+import threading
+import numpy as np
+from collections import deque
+from typing import Dict, Any, Optional
 
 # 로거 설정
 logger = logging.getLogger(__name__)
 
 
+class ContextStore:
+    """클라이언트 컨텍스트 저장소 (등록/해제와 비동기 콜백의 조회가 겹쳐도 안전하도록 잠금 사용)"""
+    
+    def __init__(self):
+        self._contexts: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def __getitem__(self, client_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return self._contexts[client_id]
+    
+    def __setitem__(self, client_id: str, client_context: Dict[str, Any]):
+        with self._lock:
+            self._contexts[client_id] = client_context
+    
+    def __contains__(self, client_id: str) -> bool:
+        with self._lock:
+            return client_id in self._contexts
+    
+    def get(self, client_id: str, default=None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._contexts.get(client_id, default)
+    
+    def pop(self, client_id: str, default=None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._contexts.pop(client_id, default)
+
+
 class ClientManager:
     def __init__(self, azure_openai_deployment_name: str, cognitive_search_index_name: str, default_tts_voice: str):
-        self.client_contexts: Dict[uuid.UUID, Dict[str, Any]] = {}
+        self.client_contexts = ContextStore()
         self.azure_openai_deployment_name = azure_openai_deployment_name
         self.cognitive_search_index_name = cognitive_search_index_name
         self.default_tts_voice = default_tts_voice
     
-    def initialize_client(self) -> uuid.UUID:
+    def initialize_client(self) -> str:
         """새 클라이언트 초기화"""
-        client_id = uuid.uuid4()
+        client_id = str(uuid.uuid4())
         self.client_contexts[client_id] = {
             'audio_input_stream': None,
-            'vad_audio_buffer': [],
+            'vad_audio_buffer': np.zeros(1024, dtype=np.int16),
+            'vad_write_pos': 0,
+            'vad_input': None,
+            'vad_input_np': None,
             'speech_recognizer': None,
             'azure_openai_deployment_name': self.azure_openai_deployment_name,
             'cognitive_search_index_name': self.cognitive_search_index_name,
@@ -28,6 +62,7 @@ class ClientManager:
             'speech_synthesizer': None,
             'speech_synthesizer_connection': None,
             'speech_synthesizer_connected': False,
+            'synthesis_stopped': None,
             'speech_token': None,
             'ice_token': None,
             'chat_initiated': False,
@@ -35,29 +70,29 @@ class ClientManager:
             'data_sources': [],
             'is_speaking': False,
             'speaking_text': None,
-            'spoken_text_queue': [],
+            'spoken_text_queue': deque(),
+            'speaking_lock': threading.Lock(),
             'speaking_thread': None,
             'last_speak_time': None
         }
         return client_id
     
-    def get_client_context(self, client_id: uuid.UUID) -> Dict[str, Any]:
+    def get_client_context(self, client_id: str) -> Dict[str, Any]:
         """클라이언트 컨텍스트 반환"""
         return self.client_contexts.get(client_id, {})
     
-    def release_client(self, client_id: uuid.UUID):
+    def release_client(self, client_id: str):
         """클라이언트 컨텍스트 해제"""
-        if client_id in self.client_contexts:
-            self.client_contexts.pop(client_id)
+        if self.client_contexts.pop(client_id) is not None:
             logger.info(f"Client context released for client {client_id}.")
     
-    def get_client_status(self, client_id: uuid.UUID) -> Dict[str, Any]:
+    def get_client_status(self, client_id: str) -> Dict[str, Any]:
         """클라이언트 상태 반환"""
         client_context = self.get_client_context(client_id)
         return {
             'speechSynthesizerConnected': client_context.get('speech_synthesizer_connected', False)
         }
     
-    def get_all_contexts(self) -> Dict[uuid.UUID, Dict[str, Any]]:
+    def get_all_contexts(self) -> ContextStore:
         """모든 클라이언트 컨텍스트 반환"""
         return self.client_contexts
@@ -33,6 +33,12 @@ class ConfigService:
         self.default_tts_voice = 'en-US-JennyMultilingualV2Neural'
         self.repeat_speaking_sentence_after_reconnection = True
         
+        # Socket.IO 직렬화 방식 (default: JSON, msgpack: 바이너리 오디오를 bin 타입으로 전송)
+        self.socketio_serializer = os.environ.get('SOCKETIO_SERIALIZER', 'default')
+        
+        # VAD (Silero ONNX 모델 경로)
+        self.vad_onnx_model_path = os.environ.get('VAD_ONNX_MODEL_PATH', 'silero_vad.onnx')
+        
         # Validate required settings
         self._validate_config()
     
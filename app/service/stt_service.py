@@ -3,13 +3,16 @@ import datetime
 import logging
 import numpy as np
 import pytz
-import torch
-import uuid
 from typing import Callable
+from util.chat_emitter import ChatResponseEmitter
+from util.vad_iterator import ENERGY_GATE_THRESHOLD, energy_gate
 
 # 로거 설정
 logger = logging.getLogger(__name__)
 
+# VAD 1회 추론 단위 (16kHz, 512 샘플)
+VAD_CHUNK_SAMPLES = 512
+
 
 class STTService:
     def __init__(self, speech_region: str, speech_key: str, language: str = 'ko-KR'):
@@ -19,7 +22,7 @@ class STTService:
     
     def connect_stt(self, client_context: dict, system_prompt: str, 
                    chat_service, speak_with_queue_func: Callable,
-                   client_id: uuid.UUID, socketio=None, vad_iterator=None,
+                   client_id: str, socketio=None, vad_iterator=None,
                    stop_speaking_func: Callable = None):
         """STT 연결"""
         try:
@@ -79,7 +82,7 @@ class STTService:
                             (recognition_result_received_time - speech_recognition_start_time).total_seconds() * 1000 
                             - speech_finished_offset
                         )
-                        logger.debug(f'STT latency: {stt_latency}ms')
+                        logger.debug('STT latency: %dms', stt_latency)
                         
                         if socketio:
                             socketio.emit("response", {
@@ -88,25 +91,21 @@ class STTService:
                             }, room=client_id)
                         
                         # 채팅 처리
-                        chat_initiated = client_context.get('chat_initiated', False)
-                        if not chat_initiated:
+                        if not client_context.get('chat_initiated'):
                             chat_service.initialize_chat_context(system_prompt, client_id)
                             client_context['chat_initiated'] = True
                         
                         first_response_chunk = True
+                        emitter = ChatResponseEmitter(socketio, client_id) if socketio else None
                         for chat_response in chat_service.handle_user_query(user_query, client_id, speak_with_queue_func):
-                            if first_response_chunk and socketio:
-                                socketio.emit("response", {
-                                    'path': 'api.chat', 
-                                    'chatResponse': 'Assistant: '
-                                }, room=client_id)
-                                first_response_chunk = False
-                            
-                            if socketio:
-                                socketio.emit("response", {
-                                    'path': 'api.chat', 
-                                    'chatResponse': chat_response
-                                }, room=client_id)
+                            if emitter:
+                                if first_response_chunk:
+                                    emitter.write('Assistant: ')
+                                    first_response_chunk = False
+                                emitter.write(chat_response)
+                        
+                        if emitter:
+                            emitter.flush()
                     
                     except Exception as e:
                         logger.error(f"Error in handling user query: {e}")
@@ -151,7 +150,7 @@ class STTService:
             client_context['audio_input_stream'] = None
     
     def handle_audio_chunk(self, client_context: dict, audio_chunk_binary: bytes, 
-                          vad_iterator=None, client_id: uuid.UUID = None, 
+                          vad_iterator=None, client_id: str = None, 
                           stop_speaking_func: Callable = None):
         """오디오 청크 처리"""
         # 오디오 스트림에 데이터 추가
@@ -160,31 +159,37 @@ class STTService:
             audio_input_stream.write(audio_chunk_binary)
         
         # VAD 처리 (Voice Activity Detection)
-        if vad_iterator:
-            audio_buffer = client_context.get('vad_audio_buffer', [])
-            audio_buffer.extend(audio_chunk_binary)
+        if vad_iterator and client_context:
+            # 클라이언트별 고정 크기 int16 버퍼에 샘플 단위로 누적하고, 512 샘플 단위로 처리한 뒤 남은 꼬리를 앞으로 당김
+            audio_buffer = client_context['vad_audio_buffer']
+            write_pos = client_context['vad_write_pos']
+            samples = np.frombuffer(audio_chunk_binary, dtype=np.int16, count=len(audio_chunk_binary) // 2)
+            
+            def on_speech_end():
+                logger.debug("Voice activity detected.")
+                if stop_speaking_func:
+                    stop_speaking_func(client_context, False)
             
-            if len(audio_buffer) >= 1024:
-                audio_chunk_int = np.frombuffer(bytes(audio_buffer[:1024]), dtype=np.int16)
-                audio_buffer.clear()
-                
-                # int16을 float32로 변환
-                audio_chunk_float = self._int2float(audio_chunk_int)
+            while len(samples):
+                copy_size = min(len(samples), len(audio_buffer) - write_pos)
+                audio_buffer[write_pos:write_pos + copy_size] = samples[:copy_size]
+                samples = samples[copy_size:]
+                write_pos += copy_size
                 
-                # VAD 검사
-                vad_detected = vad_iterator(torch.from_numpy(audio_chunk_float))
-                if vad_detected:
-                    logger.debug("Voice activity detected.")
-                    if stop_speaking_func:
-                        stop_speaking_func(client_id, False)
-    
-    def _int2float(self, sound):
-        """int16을 float32로 변환"""
-        abs_max = np.abs(sound).max()
-        if abs_max > 0:
-            sound = sound.astype('float32')
-            if abs_max < 32768.0:
-                sound = sound / 32768.0
-            else:
-                sound = sound / abs_max
-        return sound
+                while write_pos >= VAD_CHUNK_SAMPLES:
+                    if client_context['vad_input'] is None:
+                        client_context['vad_input'], client_context['vad_input_np'] = vad_iterator.allocate_input()
+                    pcm = audio_buffer[:VAD_CHUNK_SAMPLES]
+                    np.multiply(pcm, np.float32(1.0 / 32768.0), out=client_context['vad_input_np'], casting='unsafe')
+                    
+                    # VAD 검사 (ONNX 배치 처리기는 비동기로, PyTorch 모델은 즉시 처리)
+                    # 에너지가 기준 이하인 무음 프레임은 모델 추론을 건너뜀
+                    if energy_gate(pcm, ENERGY_GATE_THRESHOLD):
+                        vad_iterator.submit(client_id, client_context['vad_input'], on_speech_end)
+                    else:
+                        vad_iterator.submit_silence(client_id, client_context['vad_input'], on_speech_end)
+                    
+                    write_pos -= VAD_CHUNK_SAMPLES
+                    audio_buffer[:write_pos] = audio_buffer[VAD_CHUNK_SAMPLES:VAD_CHUNK_SAMPLES + write_pos]
+            
+            client_context['vad_write_pos'] = write_pos
@@ -546,7 +546,7 @@ function displayArchitectureDiagram(diagramPath) {
     // Create download link
     let downloadLink = document.createElement('a')
     downloadLink.href = `/api/diagram/${encodeURIComponent(diagramPath)}`
-    downloadLink.download = 'azure_architecture_diagram.png'
+    downloadLink.download = 'azure_architecture_diagram.' + (diagramPath.split('.').pop() || 'png')
     downloadLink.textContent = '📥 다이어그램 다운로드'
     downloadLink.className = 'diagram-download-link'
     downloadLink.style.display = 'inline-block'
@@ -1511,9 +1511,8 @@ window.microphone = () => {
                                 for (let i = 0; i < audioDataFloat32.length; i++) {
                                     audioDataInt16[i] = Math.max(-0x8000, Math.min(0x7FFF, audioDataFloat32[i] * 0x7FFF))
                                 }
-                                const audioDataBytes = new Uint8Array(audioDataInt16.buffer)
-                                const audioDataBase64 = btoa(String.fromCharCode(...audioDataBytes))
-                                socket.emit('message', { clientId: clientId, path: 'api.audio', audioChunk: audioDataBase64 })
+                                // PCM을 base64 인코딩 없이 바이너리 프레임으로 전송
+                                socket.emit('message', { clientId: clientId, path: 'api.audio', audioChunk: audioDataInt16.buffer })
                             }
 
                             audioSource.connect(audioWorkletNode)
@@ -0,0 +1,35 @@
+import importlib
+import os
+import sys
+import unittest
+
+# app 디렉토리를 import 경로에 추가 (app.py와 같은 방식으로 service/util 패키지를 import)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _speech_sdk_installed() -> bool:
+    try:
+        importlib.import_module('azure.cognitiveservices.speech')
+        return True
+    except ImportError:
+        return False
+
+
+class ImportTest(unittest.TestCase):
+    """모듈 로드 시점의 정의 순서/이름 오류를 잡기 위한 import 확인"""
+
+    def test_import_architecture_diagram_service(self):
+        module = importlib.import_module('service.architecture_diagram_service')
+        self.assertTrue(module.AZURE_SERVICE_NAMES)
+        self.assertIn('app_service', module._ANALYZE_SYS_PROMPT)
+
+    def test_import_chat_service(self):
+        importlib.import_module('service.chat_service')
+
+    @unittest.skipUnless(_speech_sdk_installed(), 'azure-cognitiveservices-speech not installed')
+    def test_import_app(self):
+        importlib.import_module('app')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import threading
+
+# 문장 경계 (이 문자로 끝나는 조각은 즉시 전송)
+SENTENCE_ENDINGS = ('.', '!', '?', '\n', '。')
+
+
+class ChatResponseEmitter:
+    """
+    LLM 응답 조각을 모아서 Socket.IO로 전송합니다.
+
+    조각마다 emit하는 대신 버퍼가 max_chars 이상이 되거나, 문장이 끝나거나,
+    max_delay_s가 지나면 한 번에 전송하여 JSON 인코딩/프레임 전송 횟수를 줄입니다.
+    """
+
+    def __init__(self, socketio, client_id: str, max_chars: int = 64, max_delay_s: float = 0.032):
+        self.socketio = socketio
+        self.client_id = client_id
+        # emit 메서드와 payload dict는 재사용 (emit은 반환 전에 패킷을 직렬화함)
+        self._emit = socketio.emit
+        self._payload = {'path': 'api.chat', 'chatResponse': ''}
+        self.max_chars = max_chars
+        self.max_delay_s = max_delay_s
+        self._buffer = []
+        self._buffer_size = 0
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def write(self, text: str):
+        """응답 조각을 버퍼에 추가하고 필요하면 전송합니다."""
+        with self._lock:
+            self._buffer.append(text)
+            self._buffer_size += len(text)
+            if self._buffer_size >= self.max_chars or text.endswith(SENTENCE_ENDINGS):
+                self._flush_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.max_delay_s, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """버퍼에 남은 응답을 즉시 전송합니다."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+        self._payload['chatResponse'] = ''.join(self._buffer)
+        self._buffer.clear()
+        self._buffer_size = 0
+        self._emit("response", self._payload, room=self.client_id)
@@ -0,0 +1,36 @@
+try:
+    from eventlet import patcher as eventlet_patcher, tpool
+    EVENTLET_AVAILABLE = True
+except ImportError:
+    EVENTLET_AVAILABLE = False
+
+try:
+    import gevent
+    import gevent.monkey
+    GEVENT_AVAILABLE = True
+except ImportError:
+    GEVENT_AVAILABLE = False
+
+
+def is_eventlet() -> bool:
+    """eventlet monkey patch가 적용된 상태인지 여부"""
+    return EVENTLET_AVAILABLE and eventlet_patcher.is_monkey_patched('thread')
+
+
+def is_gevent() -> bool:
+    """gevent monkey patch가 적용된 상태인지 여부"""
+    return GEVENT_AVAILABLE and gevent.monkey.is_module_patched('threading')
+
+
+def is_green() -> bool:
+    """green thread(eventlet/gevent) 환경인지 여부"""
+    return is_eventlet() or is_gevent()
+
+
+def run_blocking(func, *args, **kwargs):
+    """GIL/네이티브 호출로 블로킹되는 작업 실행 (green thread 모드에서는 실제 OS 스레드 풀로 위임)"""
+    if is_eventlet():
+        return tpool.execute(func, *args, **kwargs)
+    if is_gevent():
+        return gevent.get_hub().threadpool.apply(func, args, kwargs)
+    return func(*args, **kwargs)
@@ -0,0 +1,60 @@
+import json
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def dumps(obj, **kwargs) -> str:
+    """
+    객체를 JSON 문자열로 직렬화 (orjson 사용 가능 시 orjson 사용)
+    Socket.IO 패킷 인코더가 넘기는 separators 등의 인자는 json 폴백에서만 사용합니다.
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, **kwargs)
+
+
+def dumps_pretty(obj) -> str:
+    """들여쓰기(2칸)된 JSON 문자열로 직렬화 (프롬프트에 구조를 넣을 때 사용, 비ASCII 문자는 그대로 유지)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+def dumpb_sorted(obj) -> bytes:
+    """키를 정렬한 압축 JSON 바이트 (해시/캐시 키용, orjson 유무와 관계없이 같은 결과)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumpb(obj) -> bytes:
+    """객체를 UTF-8 JSON 바이트로 직렬화 (Response 본문용)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+
+def loads(data, **kwargs):
+    """JSON 문자열/바이트 역직렬화 (실패 시 json.JSONDecodeError 계열 예외 발생)"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data, **kwargs)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider (request.get_json / jsonify에서 orjson 사용)"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        if ORJSON_AVAILABLE and not kwargs:
+            return orjson.dumps(obj, default=self.default).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if ORJSON_AVAILABLE and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
@@ -0,0 +1,44 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class SqliteTTLCache:
+    """
+    SQLite 파일에 저장하는 만료 시간(TTL) 지원 문자열 키-값 캐시입니다.
+    항목은 저장 시각(ts)으로부터 ttl초가 지나면 조회되지 않습니다.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response BLOB, ts REAL)')
+        self.evict_expired()
+
+    def get(self, key: str, default=None):
+        """만료되지 않은 값을 반환합니다 (없거나 만료되었으면 default)."""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT response FROM llm_cache WHERE key = ? AND ts >= ?',
+                (key, time.time() - self.ttl)
+            ).fetchone()
+        if row is None:
+            return default
+        return row[0].decode('utf-8')
+
+    def set(self, key: str, value: str):
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO llm_cache (key, response, ts) VALUES (?, ?, ?)',
+                (key, value.encode('utf-8'), time.time())
+            )
+
+    def evict_expired(self):
+        """만료된 항목을 삭제합니다."""
+        with self.lock:
+            self.conn.execute('DELETE FROM llm_cache WHERE ts < ?', (time.time() - self.ttl,))
@@ -1,11 +1,39 @@
 import copy
 import logging
-import torch
+import queue
+import threading
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from util.green import run_blocking
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
 # 로거 설정
 logger = logging.getLogger(__name__)
 
+# 에너지 게이트 기준 (int16 평균 절대 진폭, float 기준 약 ±0.001)
+ENERGY_GATE_THRESHOLD = 33
+
+
+def _energy_gate_loop(pcm_i16, threshold):
+    total = 0
+    for i in range(pcm_i16.shape[0]):
+        v = np.int32(pcm_i16[i])
+        total += v if v >= 0 else -v
+    return total > threshold * pcm_i16.shape[0]
+
+
+def _energy_gate_numpy(pcm_i16, threshold):
+    return int(np.abs(pcm_i16.astype(np.int32)).sum()) > threshold * len(pcm_i16)
+
+
+# int16 PCM 프레임에 VAD 모델을 돌릴 만한 에너지가 있는지 판단 (numba 사용 가능 시 JIT 컴파일)
+energy_gate = njit(cache=True, fastmath=True)(_energy_gate_loop) if NUMBA_AVAILABLE else _energy_gate_numpy
+
 
 class VADIterator:
     def __init__(
@@ -57,12 +85,12 @@ class VADIterator:
         self.reset_states()
 
     def reset_states(self):
-        self.model.reset_states()
+        if self.model is not None:
+            self.model.reset_states()
         self.triggered = False
         self.temp_end = 0
         self.current_sample = 0
 
-    @torch.no_grad()
     def __call__(self, x):
         """
         x: torch.Tensor
@@ -71,6 +99,8 @@ class VADIterator:
         return_seconds: bool (default - False)
             whether return timestamps in seconds (default - samples)
         """
+        # torch는 PyTorch VAD 백엔드를 사용할 때만 로드
+        import torch
 
         if not torch.is_tensor(x):
             try:
@@ -79,9 +109,16 @@ class VADIterator:
                 raise TypeError("Audio cannot be casted to tensor. Cast it manually")
 
         window_size_samples = len(x[0]) if x.dim() == 2 else len(x)
-        self.current_sample += window_size_samples
+        with torch.no_grad():
+            speech_prob = self.model(x, self.sampling_rate).item()
+        return self.process_speech_prob(speech_prob, x, window_size_samples)
 
-        speech_prob = self.model(x, self.sampling_rate).item()
+    def process_speech_prob(self, speech_prob: float, x, window_size_samples: int):
+        """
+        모델이 계산한 음성 확률로 발화 상태를 갱신합니다.
+        배치 추론(VADBatchProcessor)에서 모델 호출과 분리해 사용합니다.
+        """
+        self.current_sample += window_size_samples
 
         if (speech_prob >= self.threshold) and self.temp_end:
             self.temp_end = 0
@@ -114,15 +151,206 @@ class VADIterator:
 
         return None
 
+    def allocate_input(self, window_size_samples: int = 512):
+        """
+        클라이언트별로 재사용할 입력 텐서와 이를 공유하는 numpy 뷰를 할당합니다.
+        CUDA 사용 시 pinned memory로 할당해 non_blocking 전송이 가능하도록 합니다.
+        """
+        import torch
+
+        vad_input = torch.empty(window_size_samples, dtype=torch.float32,
+                                pin_memory=torch.cuda.is_available())
+        return vad_input, vad_input.numpy()
+
+    def submit(self, client_id, vad_input, on_speech_end):
+        """오디오 청크를 동기적으로 처리하고 발화 종료 시 콜백을 호출합니다."""
+        if run_blocking(self, vad_input):
+            on_speech_end()
+
+    def submit_silence(self, client_id, vad_input, on_speech_end):
+        """무음 프레임은 모델 추론 없이 음성 확률 0으로 발화 상태만 갱신합니다."""
+        if self.process_speech_prob(0.0, vad_input, len(vad_input)):
+            on_speech_end()
 
-def int2float(sound):
+    def release(self, client_id):
+        pass
+
+
+class SileroOnnxModel:
     """
-    Taken from https://github.com/snakers4/silero-vad
+    Silero VAD v5 ONNX 모델 래퍼 (onnxruntime)
+
+    입력 윈도우는 16kHz 기준 512 샘플이며, LSTM 상태 (2, B, 128)와
+    이전 윈도우의 마지막 64 샘플(context)을 호출자가 관리할 수 있도록 노출합니다.
     """
-    sound = sound.astype("float32")
-    sound *= 1 / 32768
-    # sound = sound.squeeze()  # depends on the use case
-    return sound
+
+    WINDOW_SIZE_SAMPLES = 512
+    CONTEXT_SIZE_SAMPLES = 64
+    STATE_SHAPE = (2, 1, 128)
+
+    def __init__(self, model_path: str, providers=None, sess_options=None):
+        import onnxruntime
+
+        if sess_options is None:
+            # 작은 모델이라 연산자 내부 병렬화보다 스레드 경합 회피가 유리 (배치 처리기 스레드 1개에서 호출)
+            sess_options = onnxruntime.SessionOptions()
+            sess_options.intra_op_num_threads = 1
+            sess_options.inter_op_num_threads = 1
+            sess_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = onnxruntime.InferenceSession(
+            model_path,
+            sess_options=sess_options,
+            providers=providers or ['CUDAExecutionProvider', 'CPUExecutionProvider']
+        )
+        self.reset_states()
+
+    def reset_states(self):
+        self._state = np.zeros(self.STATE_SHAPE, dtype=np.float32)
+        self._context = np.zeros((1, self.CONTEXT_SIZE_SAMPLES), dtype=np.float32)
+
+    def run_batch(self, x: np.ndarray, state: np.ndarray, context: np.ndarray, sampling_rate: int):
+        """
+        (B, 512) 배치를 한 번의 forward로 추론합니다.
+
+        Returns
+        -------
+        (speech_probs (B,), new_state (2, B, 128), new_context (B, 64))
+        """
+        x_with_context = np.concatenate([context, x], axis=1)
+        out, new_state = self.session.run(None, {
+            'input': x_with_context,
+            'state': state,
+            'sr': np.array(sampling_rate, dtype=np.int64)
+        })
+        return out[:, 0], new_state, x_with_context[:, -self.CONTEXT_SIZE_SAMPLES:]
+
+    def __call__(self, x, sampling_rate: int):
+        x = np.asarray(x, dtype=np.float32).reshape(1, -1)
+        speech_probs, self._state, self._context = self.run_batch(x, self._state, self._context, sampling_rate)
+        return speech_probs
+
+
+class VADBatchProcessor:
+    """
+    여러 클라이언트의 VAD 청크를 모아 한 번의 ONNX forward로 처리합니다.
+
+    클라이언트별 발화 상태(VADIterator)와 LSTM 상태는 client_id 단위로 유지되며,
+    발화 종료 콜백은 추론 스레드를 막지 않도록 별도 스레드 풀에서 실행됩니다.
+    """
+
+    def __init__(self, model: SileroOnnxModel, threshold: float = 0.5, sampling_rate: int = 16000,
+                 min_silence_duration_ms: int = 150, speech_pad_ms: int = 100, max_batch_size: int = 32):
+        self.model = model
+        self.threshold = threshold
+        self.sampling_rate = sampling_rate
+        self.min_silence_duration_ms = min_silence_duration_ms
+        self.speech_pad_ms = speech_pad_ms
+        self.max_batch_size = max_batch_size
+
+        self._queue = queue.Queue()
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+        self._callback_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='vad-callback')
+
+        worker = threading.Thread(target=self._run, name='vad-batch', daemon=True)
+        worker.start()
+
+    def allocate_input(self, window_size_samples: int = 512):
+        """클라이언트별로 재사용할 float32 입력 버퍼를 할당합니다."""
+        vad_input = np.empty(window_size_samples, dtype=np.float32)
+        return vad_input, vad_input
+
+    def submit(self, client_id, audio_chunk, on_speech_end):
+        """512 샘플 float32 청크를 배치 큐에 추가합니다."""
+        self._queue.put((client_id, np.array(audio_chunk, dtype=np.float32), on_speech_end, False))
+
+    def submit_silence(self, client_id, audio_chunk, on_speech_end):
+        """무음 프레임을 큐에 추가합니다. 순서를 유지하되 모델 추론은 건너뜁니다."""
+        self._queue.put((client_id, np.array(audio_chunk, dtype=np.float32), on_speech_end, True))
+
+    def release(self, client_id):
+        """클라이언트의 VAD 상태를 해제합니다."""
+        with self._clients_lock:
+            self._clients.pop(client_id, None)
+
+    def _get_client_state(self, client_id):
+        with self._clients_lock:
+            client_state = self._clients.get(client_id)
+            if client_state is None:
+                client_state = {
+                    'iterator': VADIterator(
+                        model=None,
+                        threshold=self.threshold,
+                        sampling_rate=self.sampling_rate,
+                        min_silence_duration_ms=self.min_silence_duration_ms,
+                        speech_pad_ms=self.speech_pad_ms
+                    ),
+                    'state': np.zeros(SileroOnnxModel.STATE_SHAPE, dtype=np.float32),
+                    'context': np.zeros((1, SileroOnnxModel.CONTEXT_SIZE_SAMPLES), dtype=np.float32)
+                }
+                self._clients[client_id] = client_state
+            return client_state
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.max_batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._process_batch(items)
+            except Exception as e:
+                logger.error(f"VAD batch inference failed: {e}")
+
+    def _process_batch(self, items):
+        # 같은 클라이언트의 청크가 여러 개면 LSTM 상태가 순서대로 이어져야 하므로 라운드를 나눠 처리
+        while items:
+            batch, pending, seen = [], [], set()
+            for item in items:
+                (pending if item[0] in seen else batch).append(item)
+                seen.add(item[0])
+            items = pending
+
+            # 무음 프레임은 음성 확률 0으로 처리하고 컨텍스트만 갱신
+            voiced = []
+            for item in batch:
+                client_id, audio_chunk, on_speech_end, silent = item
+                if not silent:
+                    voiced.append(item)
+                    continue
+                client_state = self._get_client_state(client_id)
+                client_state['context'] = audio_chunk[-SileroOnnxModel.CONTEXT_SIZE_SAMPLES:].reshape(1, -1)
+                if client_state['iterator'].process_speech_prob(0.0, audio_chunk, len(audio_chunk)):
+                    self._callback_pool.submit(on_speech_end)
+            if not voiced:
+                continue
+
+            client_states = [self._get_client_state(client_id) for client_id, _, _, _ in voiced]
+            x = np.stack([audio_chunk for _, audio_chunk, _, _ in voiced])
+            state = np.concatenate([client_state['state'] for client_state in client_states], axis=1)
+            context = np.concatenate([client_state['context'] for client_state in client_states], axis=0)
+
+            speech_probs, new_state, new_context = run_blocking(
+                self.model.run_batch, x, state, context, self.sampling_rate
+            )
+
+            for i, ((_, audio_chunk, on_speech_end, _), client_state) in enumerate(zip(voiced, client_states)):
+                client_state['state'] = new_state[:, i:i + 1]
+                client_state['context'] = new_context[i:i + 1]
+                if client_state['iterator'].process_speech_prob(float(speech_probs[i]), audio_chunk, len(audio_chunk)):
+                    self._callback_pool.submit(on_speech_end)
+
+
+def quantize_vad_model(model_path: str, quantized_path: str) -> str:
+    """Silero VAD ONNX 모델을 int8 동적 양자화하여 저장 (CPU 추론용)"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
 
 
 def float2int(sound):
@@ -139,11 +367,28 @@ def float2int(sound):
 class VADService:
     def __init__(self, enable_vad: bool = False, threshold: float = 0.5, 
                  sampling_rate: int = 16000, min_silence_duration_ms: int = 150, 
-                 speech_pad_ms: int = 100):
+                 speech_pad_ms: int = 100, onnx_model_path: str = 'silero_vad.onnx',
+                 max_batch_size: int = 32):
         self.enable_vad = enable_vad
         self.vad_iterator = None
         
         if enable_vad:
+            try:
+                # ONNX Runtime(GPU 우선)로 여러 클라이언트의 청크를 배치 추론
+                vad_model = SileroOnnxModel(onnx_model_path)
+                self.vad_iterator = VADBatchProcessor(
+                    model=vad_model,
+                    threshold=threshold,
+                    sampling_rate=sampling_rate,
+                    min_silence_duration_ms=min_silence_duration_ms,
+                    speech_pad_ms=speech_pad_ms,
+                    max_batch_size=max_batch_size
+                )
+                logger.info(f"VAD service initialized with ONNX Runtime ({vad_model.session.get_providers()[0]})")
+            except Exception as e:
+                logger.warning(f"ONNX VAD model not available, falling back to PyTorch: {e}")
+            
+        if enable_vad and self.vad_iterator is None:
             try:
                 import torch
                 vad_model, _ = torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad')
@@ -162,5 +407,10 @@ class VADService:
     def get_vad_iterator(self):
         return self.vad_iterator
     
+    def release_client(self, client_id):
+        """클라이언트별 VAD 상태 해제"""
+        if self.vad_iterator:
+            self.vad_iterator.release(client_id)
+    
     def is_enabled(self) -> bool:
-        return self.enable_vad and self.vad_iterator is not None
\ No newline at end of file
+        return self.enable_vad and self.vad_iterator is not None